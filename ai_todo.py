@@ -1,14 +1,62 @@
 import sys
+
+if __name__ == '__main__' and len(sys.argv) > 1:
+    # 带参数运行时进入命令行模式，不导入Qt
+    from todo_cli import main
+    sys.exit(main())
+
+import bisect
 import json
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                             QHBoxLayout, QPushButton, QLineEdit, QTextEdit, 
                             QListWidget, QMessageBox, QCheckBox, QListWidgetItem,
-                            QMenu, QStyle)
-from PyQt6.QtCore import Qt, pyqtSignal, QSize
-from PyQt6.QtGui import QAction
-import requests
-from datetime import datetime
+                            QMenu, QStyle, QDialog, QDialogButtonBox, QFormLayout,
+                            QComboBox, QDateEdit, QFileDialog, QLabel, QAbstractItemView,
+                            QTreeView, QInputDialog, QDateTimeEdit)
+from PyQt6.QtCore import (Qt, pyqtSignal, QSize, QFileSystemWatcher, QTimer, QThread, QDate,
+                          QDateTime, QAbstractItemModel, QModelIndex, QMimeData, QByteArray)
+from PyQt6.QtGui import QAction, QColor, QFont, QFontDatabase
+import os
+from collections import deque
+from datetime import datetime, timedelta
 from functools import partial
+from todo_store import (file_lock, file_fingerprint, read_tasks, write_tasks, merge_tasks,
+                        get_current_time, new_task_id, new_task, root_id_of,
+                        TaskIndex, visible_subtasks, clean_tasks, order_of, next_order,
+                        sorted_by_order, ensure_order, move_between, TIME_FORMAT,
+                        PRIORITY_NAMES, set_task_properties, record_ids)
+from todo_reminders import DueQueue, has_pending_due, iter_visible_records, iter_subtree
+from todo_ai import AIScheduler, Prefetcher
+from todo_export import EXPORT_FORMATS, export_tasks
+from todo_import import IMPORT_FORMATS, iter_import_batches, append_batches
+from todo_telemetry import load_summary, format_summary, export_summary
+
+
+# 导入后每次事件循环插入界面的任务行数
+ROW_INSERT_CHUNK = 200
+
+# 列表项上保存的任务ID和排序键
+ID_ROLE = Qt.ItemDataRole.UserRole
+ORDER_ROLE = Qt.ItemDataRole.UserRole + 1
+
+# 各优先级的显示颜色
+PRIORITY_COLORS = ["#888", "#888", "#f39c12", "#e74c3c"]
+
+# "即将到期"窗口最多显示的条数
+NEXT_DUE_LIMIT = 100
+
+# 提醒定时器的最长间隔：休眠期间定时器不计时，较远的提醒每小时重新计算一次
+MAX_REMINDER_INTERVAL = 60 * 60 * 1000
+
+
+def describe_due(record):
+    """优先级和截止时间的简短说明，如：高 · 截止 11-08 18:00"""
+    parts = []
+    if record.get("priority", 0):
+        parts.append(PRIORITY_NAMES[record["priority"]])
+    if record.get("due"):
+        parts.append(f"截止 {record['due'][5:16]}")
+    return " · ".join(parts)
 
 
 class ClickableLineEdit(QLineEdit):
@@ -35,6 +83,13 @@ class TaskItem(QWidget):
         layout.setSpacing(8)
         layout.setAlignment(Qt.AlignmentFlag.AlignVCenter)
         
+        # 拖拽手柄不接收鼠标事件，按下时由列表开始拖拽
+        self.drag_handle = QLabel("⋮⋮")
+        self.drag_handle.setToolTip("拖动排序")
+        self.drag_handle.setAttribute(Qt.WidgetAttribute.WA_TransparentForMouseEvents)
+        self.drag_handle.setStyleSheet("color: #bbb;")
+        self.drag_handle.setCursor(Qt.CursorShape.OpenHandCursor)
+        
         self.checkbox = QCheckBox()
         self.checkbox.setChecked(is_checked)
         self.checkbox.stateChanged.connect(self.on_checkbox_changed)
@@ -57,6 +112,10 @@ class TaskItem(QWidget):
         self.text_label.clicked.connect(self.on_text_clicked)
         self.update_style(is_checked)
         
+        # 优先级和截止时间
+        self.meta_label = QLabel()
+        self.meta_label.setAttribute(Qt.WidgetAttribute.WA_TransparentForMouseEvents)
+        
         button_container = QWidget()
         button_layout = QHBoxLayout(button_container)
         button_layout.setContentsMargins(0, 0, 0, 0)
@@ -105,8 +164,10 @@ class TaskItem(QWidget):
         button_layout.addWidget(self.edit_button)
         button_layout.addWidget(self.delete_button)
         
+        layout.addWidget(self.drag_handle)
         layout.addWidget(self.checkbox)
         layout.addWidget(self.text_label, 1)
+        layout.addWidget(self.meta_label)
         layout.addWidget(button_container, 0)
         
         self.setFixedHeight(32)
@@ -169,6 +230,12 @@ class TaskItem(QWidget):
                 }
             """)
     
+    def update_meta(self, record):
+        """显示优先级和截止时间"""
+        self.meta_label.setText(describe_due(record))
+        self.meta_label.setStyleSheet(f"color: {PRIORITY_COLORS[record.get('priority', 0)]};")
+        self.meta_label.setToolTip(f"截止时间：{record['due']}" if record.get("due") else "")
+    
     def delete_task(self):
         """发送删除信号"""
         self.deleted.emit(self.listWidgetItem)
@@ -220,7 +287,542 @@ class TaskItem(QWidget):
             widget.text_label.setText(new_text)
             self.save_tasks()
 
+class ExportDialog(QDialog):
+    """导出选项：格式、是否包含已删除/已完成任务、创建日期范围"""
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("导出任务")
+        layout = QFormLayout(self)
+        
+        self.format_combo = QComboBox()
+        for fmt, name in EXPORT_FORMATS.items():
+            self.format_combo.addItem(name, fmt)
+        
+        self.hidden_checkbox = QCheckBox("包含已删除的任务")
+        self.completed_checkbox = QCheckBox("包含已完成的任务")
+        self.completed_checkbox.setChecked(True)
+        
+        self.date_checkbox = QCheckBox("按创建日期过滤")
+        self.start_date_edit = QDateEdit(QDate.currentDate().addMonths(-1))
+        self.end_date_edit = QDateEdit(QDate.currentDate())
+        for date_edit in (self.start_date_edit, self.end_date_edit):
+            date_edit.setCalendarPopup(True)
+            date_edit.setDisplayFormat("yyyy-MM-dd")
+            date_edit.setEnabled(False)
+            self.date_checkbox.toggled.connect(date_edit.setEnabled)
+        
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | 
+                                   QDialogButtonBox.StandardButton.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        
+        layout.addRow("格式：", self.format_combo)
+        layout.addRow(self.hidden_checkbox)
+        layout.addRow(self.completed_checkbox)
+        layout.addRow(self.date_checkbox)
+        layout.addRow("开始日期：", self.start_date_edit)
+        layout.addRow("结束日期：", self.end_date_edit)
+        layout.addRow(buttons)
+    
+    def export_format(self):
+        return self.format_combo.currentData()
+    
+    def filters(self):
+        filters = {
+            "include_hidden": self.hidden_checkbox.isChecked(),
+            "include_completed": self.completed_checkbox.isChecked(),
+        }
+        if self.date_checkbox.isChecked():
+            filters["start_date"] = self.start_date_edit.date().toString("yyyy-MM-dd")
+            filters["end_date"] = self.end_date_edit.date().toString("yyyy-MM-dd")
+        return filters
+
+class TaskPropertiesDialog(QDialog):
+    """设置任务或子任务的优先级和截止时间"""
+    
+    def __init__(self, record, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("优先级和截止时间")
+        layout = QFormLayout(self)
+        
+        self.priority_combo = QComboBox()
+        self.priority_combo.addItems(PRIORITY_NAMES)
+        self.priority_combo.setCurrentIndex(record.get("priority", 0))
+        
+        due = record.get("due")
+        self.due_checkbox = QCheckBox("设置截止时间")
+        self.due_checkbox.setChecked(bool(due))
+        self.due_edit = QDateTimeEdit(QDateTime.fromString(due, "yyyy-MM-dd HH:mm:ss") if due
+                                      else QDateTime.currentDateTime().addDays(1))
+        self.due_edit.setCalendarPopup(True)
+        self.due_edit.setDisplayFormat("yyyy-MM-dd HH:mm")
+        self.due_edit.setEnabled(bool(due))
+        self.due_checkbox.toggled.connect(self.due_edit.setEnabled)
+        
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | 
+                                   QDialogButtonBox.StandardButton.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        
+        layout.addRow("任务：", QLabel(record["text"]))
+        layout.addRow("优先级：", self.priority_combo)
+        layout.addRow(self.due_checkbox)
+        layout.addRow("截止时间：", self.due_edit)
+        layout.addRow(buttons)
+    
+    def priority(self):
+        return self.priority_combo.currentIndex()
+    
+    def due(self):
+        if not self.due_checkbox.isChecked():
+            return None
+        return self.due_edit.dateTime().toString("yyyy-MM-dd HH:mm:00")
+
+class NextDueDialog(QDialog):
+    """即将到期：按截止时间列出未完成的任务和子任务，双击跳转到该任务"""
+    recordActivated = pyqtSignal(object)
+    
+    def __init__(self, entries, task_index, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("即将到期")
+        self.resize(600, 400)
+        layout = QVBoxLayout(self)
+        
+        self.list_widget = QListWidget()
+        now = get_current_time()
+        for due, record_id in entries:
+            record = task_index.get(record_id)
+            if record is None:
+                continue
+            item = QListWidgetItem(f"{due[:16]}  {record['text']}")
+            item.setData(ID_ROLE, record_id)
+            priority = record.get("priority", 0)
+            if priority:
+                item.setText(f"{item.text()}  [{PRIORITY_NAMES[priority]}]")
+            if due <= now:
+                item.setForeground(QColor("#e74c3c"))
+                item.setToolTip("已过期")
+            self.list_widget.addItem(item)
+        if self.list_widget.count() == 0:
+            self.list_widget.addItem("没有设置截止时间的未完成任务")
+        self.list_widget.itemDoubleClicked.connect(self.on_item_double_clicked)
+        
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Close)
+        buttons.rejected.connect(self.reject)
+        
+        layout.addWidget(self.list_widget)
+        layout.addWidget(buttons)
+    
+    def on_item_double_clicked(self, item):
+        record_id = item.data(ID_ROLE)
+        if record_id is not None:
+            self.recordActivated.emit(record_id)
+            self.accept()
+
+class StatsDialog(QDialog):
+    """AI调用统计：每天的调用次数、失败数、延迟百分位数、Token用量和费用"""
+    
+    def __init__(self, config, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("AI调用统计")
+        self.resize(900, 400)
+        self.config = config
+        layout = QVBoxLayout(self)
+        
+        self.summary_area = QTextEdit()
+        self.summary_area.setReadOnly(True)
+        self.summary_area.setFont(QFontDatabase.systemFont(QFontDatabase.SystemFont.FixedFont))
+        self.summary_area.setLineWrapMode(QTextEdit.LineWrapMode.NoWrap)
+        
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Close)
+        refresh_button = buttons.addButton("刷新", QDialogButtonBox.ButtonRole.ActionRole)
+        refresh_button.clicked.connect(self.refresh)
+        export_button = buttons.addButton("导出JSON", QDialogButtonBox.ButtonRole.ActionRole)
+        export_button.clicked.connect(self.export_json)
+        buttons.rejected.connect(self.reject)
+        
+        layout.addWidget(self.summary_area)
+        layout.addWidget(buttons)
+        self.refresh()
+    
+    def refresh(self):
+        self.summary = load_summary(self.config)
+        self.summary_area.setPlainText(format_summary(self.summary))
+    
+    def export_json(self):
+        path, _ = QFileDialog.getSaveFileName(self, "导出统计", "ai_stats.json", "JSON (*.json)")
+        if not path:
+            return
+        try:
+            export_summary(self.summary, path)
+        except OSError as e:
+            QMessageBox.critical(self, "错误", f"导出失败：{str(e)}")
+
+class ExportWorker(QThread):
+    """在后台线程中流式导出任务"""
+    progress = pyqtSignal(int, int)
+    succeeded = pyqtSignal(int)
+    failed = pyqtSignal(str)
+    
+    def __init__(self, tasks, path, fmt, filters, parent=None):
+        super().__init__(parent)
+        self.tasks = tasks
+        self.path = path
+        self.fmt = fmt
+        self.filters = filters
+    
+    def run(self):
+        try:
+            count = export_tasks(self.tasks, self.path, self.fmt,
+                                 progress=self.progress.emit, **self.filters)
+        except Exception as e:
+            self.failed.emit(str(e))
+        else:
+            self.succeeded.emit(count)
+
+class ImportWorker(QThread):
+    """在后台线程中解析导入文件，解析全部成功后才交给界面写入
+
+    导入是一次事务：文件后面出错时不能留下前面的任务。如果逐批交给界面，
+    已显示的任务要再撤销，期间用户新建的任务也可能和导入任务的ID冲突，
+    所以解析结果先留在内存中（只是解析后的任务数据），最后一次写入。
+    """
+    progress = pyqtSignal(int)
+    succeeded = pyqtSignal(list)
+    failed = pyqtSignal(str)
+    
+    def __init__(self, path, fmt, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.fmt = fmt
+    
+    def run(self):
+        batches = []
+        count = 0
+        try:
+            with open(self.path, 'r', encoding='utf-8', newline='') as f:
+                for batch in iter_import_batches(f, self.fmt):
+                    batches.append(batch)
+                    count += len(batch)
+                    self.progress.emit(count)
+        except Exception as e:
+            self.failed.emit(str(e))
+        else:
+            self.succeeded.emit(batches)
+
+class SubtaskNode:
+    """子任务树中已加载到界面的一个节点"""
+    __slots__ = ("record", "parent", "row", "children", "unfetched")
+    
+    def __init__(self, record, parent, row):
+        self.record = record
+        self.parent = parent
+        self.row = row
+        self.children = []
+        # 尚未加载的子任务（按排序键倒序，便于从末尾取出），None 表示还没有展开过
+        self.unfetched = None
+
+class SubtaskTreeModel(QAbstractItemModel):
+    """当前主任务的子任务树
+    
+    子节点只在展开时按批加载（canFetchMore/fetchMore），是否有子节点
+    直接读取 TaskIndex 的计数，不需要遍历子树。
+    """
+    MIME_TYPE = "application/x-ai-todo-subtask"
+    FETCH_CHUNK = 200
+    
+    statusChanged = pyqtSignal(object, bool)
+    textEdited = pyqtSignal(object, str)
+    moved = pyqtSignal(object, object, object)  # 记录, 前一条, 后一条
+    
+    def __init__(self, task_index, parent=None):
+        super().__init__(parent)
+        self.task_index = task_index
+        self.root = None
+        self.loaded = {}  # 记录ID -> 已加载的 SubtaskNode
+    
+    def set_task(self, task_data):
+        """切换显示的主任务，task_data 为None时清空"""
+        self.beginResetModel()
+        self.root = SubtaskNode(task_data, None, 0) if task_data else None
+        self.loaded = {}
+        self.endResetModel()
+        if self.canFetchMore(QModelIndex()):
+            self.fetchMore(QModelIndex())
+    
+    def node(self, index):
+        return index.internalPointer() if index.isValid() else self.root
+    
+    def index_of(self, node):
+        if node is None or node is self.root:
+            return QModelIndex()
+        return self.createIndex(node.row, 0, node)
+    
+    def record_at(self, index):
+        return index.internalPointer().record if index.isValid() else None
+    
+    # ---- 只读接口 ----
+    
+    def index(self, row, column, parent=QModelIndex()):
+        node = self.node(parent)
+        if node is None or column != 0 or not 0 <= row < len(node.children):
+            return QModelIndex()
+        return self.createIndex(row, 0, node.children[row])
+    
+    def parent(self, index=None):
+        if index is None:
+            return super().parent()
+        if not index.isValid():
+            return QModelIndex()
+        return self.index_of(index.internalPointer().parent)
+    
+    def rowCount(self, parent=QModelIndex()):
+        node = self.node(parent)
+        return len(node.children) if node is not None and parent.column() <= 0 else 0
+    
+    def columnCount(self, parent=QModelIndex()):
+        return 1
+    
+    def hasChildren(self, parent=QModelIndex()):
+        node = self.node(parent)
+        if node is None:
+            return False
+        return bool(node.children) or self.task_index.has_visible_children(node.record)
+    
+    def canFetchMore(self, parent):
+        node = self.node(parent)
+        if node is None:
+            return False
+        if node.unfetched is None:
+            return self.task_index.has_visible_children(node.record)
+        return bool(node.unfetched)
+    
+    def fetchMore(self, parent):
+        node = self.node(parent)
+        if node is None:
+            return
+        if node.unfetched is None:
+            node.unfetched = sorted_by_order(visible_subtasks(node.record))
+            node.unfetched.reverse()
+        count = min(self.FETCH_CHUNK, len(node.unfetched))
+        if not count:
+            return
+        start = len(node.children)
+        self.beginInsertRows(parent, start, start + count - 1)
+        for row in range(start, start + count):
+            record = node.unfetched.pop()
+            child = SubtaskNode(record, node, row)
+            node.children.append(child)
+            self.loaded[record["id"]] = child
+        self.endInsertRows()
+    
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        record = index.internalPointer().record
+        completed = record.get("completed", False)
+        if role == Qt.ItemDataRole.DisplayRole:
+            meta = describe_due(record)
+            return f"{record['text']}    {meta}" if meta else record["text"]
+        if role == Qt.ItemDataRole.EditRole:
+            return record["text"]
+        if role == Qt.ItemDataRole.CheckStateRole:
+            return Qt.CheckState.Checked if completed else Qt.CheckState.Unchecked
+        if role == Qt.ItemDataRole.ToolTipRole:
+            if record.get("due"):
+                return f"{record['id']}  截止时间：{record['due']}"
+            return record["id"]
+        if role == Qt.ItemDataRole.ForegroundRole and completed:
+            return QColor("#2ecc71")
+        if role == Qt.ItemDataRole.FontRole and completed:
+            font = QFont()
+            font.setStrikeOut(True)
+            return font
+        return None
+    
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.ItemFlag.ItemIsDropEnabled
+        return (Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable |
+                Qt.ItemFlag.ItemIsEditable | Qt.ItemFlag.ItemIsUserCheckable |
+                Qt.ItemFlag.ItemIsDragEnabled | Qt.ItemFlag.ItemIsDropEnabled)
+    
+    def setData(self, index, value, role=Qt.ItemDataRole.EditRole):
+        """数据由界面统一修改，这里只发出信号"""
+        if not index.isValid():
+            return False
+        record = index.internalPointer().record
+        if role == Qt.ItemDataRole.CheckStateRole:
+            self.statusChanged.emit(record, Qt.CheckState(value) == Qt.CheckState.Checked)
+            return True
+        if role == Qt.ItemDataRole.EditRole:
+            text = str(value).strip()
+            if text and text != record["text"]:
+                self.textEdited.emit(record, text)
+            return True
+        return False
+    
+    # ---- 拖拽排序：只允许在同一父任务下移动 ----
+    
+    def supportedDropActions(self):
+        return Qt.DropAction.MoveAction
+    
+    def mimeTypes(self):
+        return [self.MIME_TYPE]
+    
+    def mimeData(self, indexes):
+        mime_data = QMimeData()
+        if indexes:
+            record_id = indexes[0].internalPointer().record["id"]
+            mime_data.setData(self.MIME_TYPE, QByteArray(record_id.encode('utf-8')))
+        return mime_data
+    
+    def dropMimeData(self, data, action, row, column, parent):
+        if action != Qt.DropAction.MoveAction or not data.hasFormat(self.MIME_TYPE):
+            return False
+        node = self.loaded.get(bytes(data.data(self.MIME_TYPE)).decode('utf-8'))
+        target = self.node(parent)
+        if node is None or target is not node.parent:
+            return False
+        siblings = target.children
+        if row < 0:
+            row = len(siblings)
+        if row in (node.row, node.row + 1):
+            return False
+        before = siblings[row - 1].record if row > 0 else None
+        if row < len(siblings):
+            after = siblings[row].record
+        else:
+            # 拖到已加载部分的末尾时，排在第一条未加载的子任务之前
+            after = target.unfetched[-1] if target.unfetched else None
+        old_row = node.row
+        self.beginMoveRows(parent, old_row, old_row, parent, row)
+        del siblings[old_row]
+        siblings.insert(row if row < old_row else row - 1, node)
+        self._renumber(siblings, min(row, old_row))
+        self.endMoveRows()
+        self.moved.emit(node.record, before, after)
+        return True
+    
+    # ---- 数据变化后的增量更新 ----
+    
+    @staticmethod
+    def _renumber(children, start):
+        for row in range(start, len(children)):
+            children[row].row = row
+    
+    def node_for_record(self, record):
+        if self.root is not None and record is self.root.record:
+            return self.root
+        return self.loaded.get(record["id"])
+    
+    def load_record(self, record):
+        """逐级加载到指定记录，返回其索引；记录不在当前主任务下时返回无效索引"""
+        if self.root is None:
+            return QModelIndex()
+        path = []
+        node = record
+        while node is not None and node is not self.root.record:
+            path.append(node)
+            node = self.task_index.parent(node)
+        if node is None:
+            return QModelIndex()
+        parent = self.root
+        for child in reversed(path):
+            while child["id"] not in self.loaded and self.canFetchMore(self.index_of(parent)):
+                self.fetchMore(self.index_of(parent))
+            parent = self.loaded.get(child["id"])
+            if parent is None:
+                return QModelIndex()
+        return self.index_of(parent)
+    
+    def refresh_record(self, record):
+        node = self.node_for_record(record)
+        if node is not None and node is not self.root:
+            index = self.index_of(node)
+            self.dataChanged.emit(index, index)
+    
+    def refresh_all(self):
+        """主任务状态变化后刷新所有已加载的行"""
+        for node in [self.root] + list(self.loaded.values()):
+            if node is not None and node.children:
+                first = self.index_of(node.children[0])
+                last = self.index_of(node.children[-1])
+                self.dataChanged.emit(first, last)
+    
+    def insert_records(self, parent_record, records):
+        """在已加载的父节点下按排序键插入新记录"""
+        parent = self.node_for_record(parent_record)
+        if parent is None:
+            return
+        if parent.unfetched is None:
+            if self.task_index.counts[parent_record["id"]][0] > len(records):
+                # 已有其他子任务但还没有展开过，展开时会从数据中加载
+                return
+            parent.unfetched = []
+        parent_index = self.index_of(parent)
+        for record in records:
+            if record["id"] in self.loaded or any(r is record for r in parent.unfetched):
+                continue
+            orders = [order_of(child.record) for child in parent.children]
+            row = bisect.bisect_right(orders, order_of(record))
+            if row == len(parent.children) and parent.unfetched:
+                # 位于未加载部分，等下一次 fetchMore 再显示
+                unfetched_orders = [-order_of(r) for r in parent.unfetched]
+                position = bisect.bisect_left(unfetched_orders, -order_of(record))
+                parent.unfetched.insert(position, record)
+                continue
+            self.beginInsertRows(parent_index, row, row)
+            node = SubtaskNode(record, parent, row)
+            parent.children.insert(row, node)
+            self._renumber(parent.children, row)
+            self.loaded[record["id"]] = node
+            self.endInsertRows()
+    
+    def remove_record(self, record):
+        node = self.loaded.get(record["id"])
+        if node is None:
+            # 可能还在父节点未加载的部分中
+            parent_record = self.task_index.parent(record)
+            parent = self.node_for_record(parent_record) if parent_record else None
+            if parent is not None and parent.unfetched:
+                parent.unfetched = [r for r in parent.unfetched if r is not record]
+            return
+        parent = node.parent
+        self.beginRemoveRows(self.index_of(parent), node.row, node.row)
+        del parent.children[node.row]
+        self._renumber(parent.children, node.row)
+        stack = [node]
+        while stack:
+            removed = stack.pop()
+            self.loaded.pop(removed.record["id"], None)
+            stack.extend(removed.children)
+        self.endRemoveRows()
+    
+    def sync_record(self, record):
+        """外部合并后同步一条记录：新增、隐藏、改顺序或改内容"""
+        node = self.loaded.get(record["id"])
+        if record.get("hidden", False):
+            self.remove_record(record)
+            return
+        if node is not None:
+            siblings = node.parent.children
+            row = node.row
+            if ((row > 0 and order_of(siblings[row - 1].record) > order_of(record)) or
+                    (row + 1 < len(siblings) and order_of(siblings[row + 1].record) < order_of(record))):
+                self.remove_record(record)
+            else:
+                self.refresh_record(record)
+                return
+        parent = self.task_index.parent(record)
+        if parent is not None:
+            self.insert_records(parent, [record])
+
 class AITodoApp(QMainWindow):
+    # AI调度器在工作线程中回调，通过信号转到界面线程处理
+    subtasksGenerated = pyqtSignal(object, object, object)
+    
     def __init__(self):
         super().__init__()
         self.setWindowTitle("AI Todo List")
@@ -260,15 +862,25 @@ class AITodoApp(QMainWindow):
         # 加载配置
         with open('config.json', 'r', encoding='utf-8') as f:
             self.config = json.load(f)
+        self.ai_scheduler = AIScheduler(self.config)
+        self.ai_prefetcher = Prefetcher.from_config(self.ai_scheduler, self.config)
+        self.subtasksGenerated.connect(self.on_subtasks_generated)
         
         self.tasks_file = 'tasks.json'
+        self.tasks_fingerprint = None
         self.tasks_data = self.load_tasks()
+        ensure_order(self.tasks_data["tasks"])
+        # 按ID查找任意层级的记录，并维护每个节点的完成计数
+        self.task_index = TaskIndex(self.tasks_data["tasks"])
         
         self.current_task = None
         self.next_task_id = 1
+        self.task_items = {}  # 任务ID -> 主任务列表中的QListWidgetItem
         
         self.init_ui()
         self.load_tasks_to_ui()
+        self.init_reminders()
+        self.init_file_watcher()
     
     def init_ui(self):
         central_widget = QWidget()
@@ -283,6 +895,19 @@ class AITodoApp(QMainWindow):
         self.task_input.setPlaceholderText("输入新任务...")
         self.add_button = QPushButton("添加")
         self.add_button.clicked.connect(self.add_task)
+        self.export_button = QPushButton("导出")
+        self.export_button.clicked.connect(self.export_tasks)
+        self.export_worker = None
+        self.import_button = QPushButton("导入")
+        self.import_button.clicked.connect(self.import_tasks)
+        self.import_worker = None
+        self.stats_button = QPushButton("AI统计")
+        self.stats_button.clicked.connect(self.show_ai_stats)
+        self.next_due_button = QPushButton("即将到期")
+        self.next_due_button.clicked.connect(self.show_next_due)
+        self.pending_rows = deque()
+        self.row_insert_timer = QTimer(self)
+        self.row_insert_timer.timeout.connect(self.insert_pending_rows)
         
         self.task_list = QListWidget()
         self.task_list.setSpacing(1)
@@ -291,6 +916,9 @@ class AITodoApp(QMainWindow):
         self.task_list.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
         self.task_list.customContextMenuRequested.connect(self.show_context_menu)
         self.task_list.setMinimumWidth(500)
+        self.task_list.setDragDropMode(QAbstractItemView.DragDropMode.InternalMove)
+        self.task_list.setDefaultDropAction(Qt.DropAction.MoveAction)
+        self.task_list.model().rowsMoved.connect(self.on_task_rows_moved)
         self.task_list.setStyleSheet("""
             QListWidget {
                 border: 1px solid #ddd;
@@ -322,6 +950,10 @@ class AITodoApp(QMainWindow):
         task_input_layout = QHBoxLayout()
         task_input_layout.addWidget(self.task_input)
         task_input_layout.addWidget(self.add_button)
+        task_input_layout.addWidget(self.import_button)
+        task_input_layout.addWidget(self.export_button)
+        task_input_layout.addWidget(self.next_due_button)
+        task_input_layout.addWidget(self.stats_button)
         left_layout.addLayout(task_input_layout)
         
         left_layout.addWidget(self.task_list)
@@ -343,22 +975,34 @@ class AITodoApp(QMainWindow):
             }
         """)
         
-        # 子任务列表
-        self.subtasks_list = QListWidget()
-        self.subtasks_list.setAlternatingRowColors(True)
-        self.subtasks_list.setStyleSheet("""
-            QListWidget {
+        # 子任务树，子任务可以继续展开下级子任务
+        self.subtask_model = SubtaskTreeModel(self.task_index, self)
+        self.subtask_model.statusChanged.connect(self.update_subtask_status)
+        self.subtask_model.textEdited.connect(self.edit_subtask)
+        self.subtask_model.moved.connect(self.on_subtask_moved)
+        self.subtask_tree = QTreeView()
+        self.subtask_tree.setModel(self.subtask_model)
+        self.subtask_tree.setHeaderHidden(True)
+        self.subtask_tree.setAlternatingRowColors(True)
+        self.subtask_tree.setUniformRowHeights(True)
+        self.subtask_tree.setDragDropMode(QAbstractItemView.DragDropMode.InternalMove)
+        self.subtask_tree.setDefaultDropAction(Qt.DropAction.MoveAction)
+        self.subtask_tree.setEditTriggers(QAbstractItemView.EditTrigger.DoubleClicked |
+                                          QAbstractItemView.EditTrigger.EditKeyPressed)
+        self.subtask_tree.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
+        self.subtask_tree.customContextMenuRequested.connect(self.show_subtask_context_menu)
+        self.subtask_tree.setStyleSheet("""
+            QTreeView {
                 border: 1px solid #ddd;
                 border-radius: 4px;
                 background-color: white;
                 padding: 1px;
             }
-            QListWidget::item {
+            QTreeView::item {
                 padding: 1px;
-                margin: 1px;
                 min-height: 32px;
             }
-            QListWidget::item:alternate {
+            QTreeView::item:alternate {
                 background-color: #f8f9fa;
             }
         """)
@@ -382,7 +1026,7 @@ class AITodoApp(QMainWindow):
         self.generate_button.clicked.connect(self.generate_subtasks)
         
         right_layout.addWidget(self.task_info_area)
-        right_layout.addWidget(self.subtasks_list)
+        right_layout.addWidget(self.subtask_tree)
         right_layout.addWidget(subtask_input_widget)
         right_layout.addWidget(self.generate_button)
         
@@ -391,51 +1035,352 @@ class AITodoApp(QMainWindow):
         layout.addWidget(right_widget)
     
     def load_tasks(self):
-        try:
-            with open(self.tasks_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return {"tasks": []}
+        with file_lock(self.tasks_file):
+            self.tasks_fingerprint = file_fingerprint(self.tasks_file)
+            data = read_tasks(self.tasks_file)
+            # 文件中已有的记录ID，之后从文件中消失的记录视为被外部删除
+            self.saved_ids = record_ids(data["tasks"])
+            return data
     
     def save_tasks(self):
-        """保任务到文件"""
-        self.tasks_data["tasks"] = self.clean_data_for_save()
-        with open(self.tasks_file, 'w', encoding='utf-8') as f:
-            json.dump(self.tasks_data, f, ensure_ascii=False, indent=2)
+        """保存任务到文件，写入前先合并其他进程的修改"""
+        with file_lock(self.tasks_file):
+            fingerprint = file_fingerprint(self.tasks_file)
+            if fingerprint != self.tasks_fingerprint:
+                try:
+                    remote_data = read_tasks(self.tasks_file)
+                except ValueError:
+                    # 其他程序可能正在非原子地写入，或写入了格式不对的数据：
+                    # 不覆盖它，保留旧指纹稍后重试
+                    self.statusBar().showMessage("任务文件正被其他程序修改，稍后重试保存", 3000)
+                    self.save_retry_timer.start()
+                    return
+                self.apply_external_changes(remote_data, fingerprint is not None)
+            # 只写入清理后的副本，内存中的记录保持不变，索引和子任务树仍然有效
+            self.tasks_fingerprint = write_tasks(self.tasks_file,
+                                                 {"tasks": self.clean_data_for_save()})
+            self.saved_ids = record_ids(self.tasks_data["tasks"])
+    
+    def init_file_watcher(self):
+        """监视任务文件，其他进程修改后增量合并"""
+        self.file_watcher = QFileSystemWatcher(self)
+        self.file_watcher.fileChanged.connect(self.schedule_external_check)
+        self.file_watcher.directoryChanged.connect(self.schedule_external_check)
+        # 外部写入通常是连续多次，合并成一次检查
+        self.external_check_timer = QTimer(self)
+        self.external_check_timer.setSingleShot(True)
+        self.external_check_timer.setInterval(200)
+        self.external_check_timer.timeout.connect(self.check_external_changes)
+        # 文件内容不完整时推迟保存
+        self.save_retry_timer = QTimer(self)
+        self.save_retry_timer.setSingleShot(True)
+        self.save_retry_timer.setInterval(1000)
+        self.save_retry_timer.timeout.connect(self.save_tasks)
+        self.watch_tasks_file()
+    
+    def init_reminders(self):
+        """截止时间提醒
+
+        due_queue 保存所有未完成且设置了截止时间的记录，用于"即将到期"窗口；
+        reminder_queue 只保存还没有提醒过的记录。两者都是最小堆，
+        只用一个单次定时器等待最近的提醒时间，两次提醒之间不占用CPU。
+        reminded 记录已经提醒过的截止时间，同一截止时间只提醒一次。
+        """
+        self.due_queue = DueQueue.from_tasks(self.tasks_data["tasks"])
+        self.reminder_queue = self.due_queue.copy()
+        self.reminded = {}  # 记录ID -> 已提醒的截止时间
+        self.reminder_lead = timedelta(minutes=int(self.config.get("reminder_lead_minutes", 0)))
+        self.reminder_timer = QTimer(self)
+        self.reminder_timer.setSingleShot(True)
+        self.reminder_timer.setTimerType(Qt.TimerType.VeryCoarseTimer)
+        self.reminder_timer.timeout.connect(self.fire_reminders)
+        self.arm_reminder_timer()
+    
+    def arm_reminder_timer(self):
+        """按堆顶的截止时间重新设置定时器"""
+        top = self.reminder_queue.peek()
+        if top is None:
+            self.reminder_timer.stop()
+            return
+        remind_at = datetime.strptime(top[0], TIME_FORMAT) - self.reminder_lead
+        delay = (remind_at - datetime.now()).total_seconds() * 1000
+        self.reminder_timer.start(int(min(max(delay, 0), MAX_REMINDER_INTERVAL)))
+    
+    def fire_reminders(self):
+        """弹出所有已到提醒时间的任务，然后等待下一个"""
+        limit = (datetime.now() + self.reminder_lead).strftime(TIME_FORMAT)
+        records = [self.task_index.get(record_id)
+                   for _, record_id in self.reminder_queue.pop_until(limit)]
+        records = [record for record in records if record is not None and has_pending_due(record)]
+        for record in records:
+            self.reminded[record["id"]] = record["due"]
+        if records:
+            self.show_reminders(records)
+        self.arm_reminder_timer()
+    
+    def show_reminders(self, records):
+        now = get_current_time()
+        lines = [f"{'已过期' if record['due'] <= now else '即将到期'}  "
+                 f"{record['due'][:16]}  {record['text']}" for record in records[:20]]
+        if len(records) > 20:
+            lines.append(f"……共 {len(records)} 个任务")
+        self.statusBar().showMessage(f"{len(records)} 个任务到期", 10000)
+        QApplication.alert(self)
+        # 非模态提示，不打断正在进行的编辑
+        box = QMessageBox(QMessageBox.Icon.Information, "任务提醒", "\n".join(lines),
+                          QMessageBox.StandardButton.Ok, self)
+        box.setWindowModality(Qt.WindowModality.NonModal)
+        box.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose)
+        box.show()
+    
+    def update_reminders(self, records):
+        """记录的截止时间或完成状态变化后更新两个队列（每条 O(log n)），然后重新设置定时器"""
+        now = get_current_time()
+        for record in records:
+            self.due_queue.update(record)
+            if not has_pending_due(record):
+                # 完成或删除后忘记提醒记录，重新打开时可以再次提醒
+                self.reminded.pop(record["id"], None)
+                self.reminder_queue.remove(record["id"])
+            elif self.reminded.get(record["id"]) == record["due"]:
+                # 这个截止时间已经提醒过（提前提醒时截止时间可能还没到）
+                continue
+            else:
+                self.reminded.pop(record["id"], None)
+                # 已经过了截止时间的任务不再重复提醒
+                if record["due"] > now:
+                    self.reminder_queue.update(record)
+                else:
+                    self.reminder_queue.remove(record["id"])
+        self.arm_reminder_timer()
+    
+    def forget_reminders(self, record):
+        """删除任务后移除它及所有下级子任务的提醒"""
+        for node in iter_subtree(record):
+            self.due_queue.remove(node["id"])
+            self.reminder_queue.remove(node["id"])
+            self.reminded.pop(node["id"], None)
+        self.arm_reminder_timer()
+    
+    def show_next_due(self):
+        dialog = NextDueDialog(self.due_queue.nsmallest(NEXT_DUE_LIMIT), self.task_index, self)
+        dialog.recordActivated.connect(self.select_record)
+        dialog.exec()
+    
+    def select_record(self, record_id):
+        """选中任务；子任务会逐级展开并定位"""
+        item = self.task_items.get(root_id_of(record_id))
+        if item is None:
+            return
+        self.task_list.scrollToItem(item)
+        self.show_subtasks(item)
+        if not isinstance(record_id, int):
+            index = self.subtask_model.load_record(self.task_index.get(record_id))
+            if index.isValid():
+                self.subtask_tree.scrollTo(index)
+                self.subtask_tree.setCurrentIndex(index)
+    
+    def edit_task_properties(self, record):
+        """设置优先级和截止时间"""
+        dialog = TaskPropertiesDialog(record, self)
+        if dialog.exec() != QDialog.DialogCode.Accepted:
+            return
+        set_task_properties(record, dialog.priority(), dialog.due(), self.get_current_time())
+        if isinstance(record["id"], int):
+            self.refresh_task_row(record)
+        else:
+            self.subtask_model.refresh_record(record)
+        self.update_reminders([record])
+        self.update_task_info()
+        self.save_tasks()
+    
+    def watch_tasks_file(self):
+        # 原子替换后文件会从监视列表中消失，需要重新添加
+        tasks_path = os.path.abspath(self.tasks_file)
+        directory = os.path.dirname(tasks_path)
+        if directory not in self.file_watcher.directories():
+            self.file_watcher.addPath(directory)
+        if os.path.exists(tasks_path) and tasks_path not in self.file_watcher.files():
+            self.file_watcher.addPath(tasks_path)
+    
+    def schedule_external_check(self, path=None):
+        self.external_check_timer.start()
+    
+    def check_external_changes(self):
+        """通过文件指纹判断任务文件是否被外部修改"""
+        self.watch_tasks_file()
+        if file_fingerprint(self.tasks_file) == self.tasks_fingerprint:
+            return
+        with file_lock(self.tasks_file):
+            fingerprint = file_fingerprint(self.tasks_file)
+            try:
+                remote_data = read_tasks(self.tasks_file)
+            except ValueError:
+                # 其他程序可能正在非原子地写入或写入了格式不对的数据，等下一次变化再处理
+                return
+            self.tasks_fingerprint = fingerprint
+            self.apply_external_changes(remote_data, fingerprint is not None)
+    
+    def apply_external_changes(self, remote_data, file_exists=True):
+        """合并外部数据，只更新发生变化的任务行和子任务行
+
+        文件被删除时不把其中原有的记录当作已删除，保存时会重新写入。
+        """
+        changes = merge_tasks(self.tasks_data, remote_data,
+                              self.saved_ids if file_exists else None)
+        self.saved_ids = record_ids(remote_data["tasks"])
+        if not changes:
+            return
+        tasks_by_id = {task["id"]: task for task in self.tasks_data["tasks"]}
+        # 每个变化的主任务只重新登记一次，其下的计数随之重建
+        for task_id in {task_id for task_id, _ in changes}:
+            self.task_index.add(tasks_by_id[task_id])
+        current_task_id = None
+        if self.current_task:
+            current_task_id = self.task_list.itemWidget(self.current_task).task_id
+        
+        for task_id, subtask_id in changes:
+            task_data = tasks_by_id[task_id]
+            if subtask_id is None:
+                self.refresh_task_row(task_data)
+                self.next_task_id = max(self.next_task_id, task_id + 1)
+            if task_id == current_task_id and self.current_task:
+                if subtask_id is None:
+                    self.update_task_info()
+                else:
+                    self.subtask_model.sync_record(self.task_index.get(subtask_id))
+        
+        # 截止时间或完成状态可能被其他程序修改
+        records = []
+        for task_id, subtask_id in changes:
+            record = self.task_index.get(task_id if subtask_id is None else subtask_id)
+            if record.get("hidden", False):
+                self.forget_reminders(record)
+            else:
+                records.extend(iter_visible_records([record]))
+        self.update_reminders(records)
+    
+    def refresh_task_row(self, task_data):
+        """根据数据更新单个主任务行（新增、移除或刷新）"""
+        item = self.task_items.get(task_data["id"])
+        if task_data.get("hidden", False):
+            if item:
+                self.delete_task_row(item)
+            return
+        if item is not None and item.data(ORDER_ROLE) != task_data["order"]:
+            # 其他程序调整了顺序，移到新位置
+            is_current = self.current_task == item
+            self.task_list.takeItem(self.task_list.row(item))
+            del self.task_items[task_data["id"]]
+            item = None
+            if is_current:
+                self.current_task = self.add_task_to_ui(
+                    task_data, self.row_for_order(self.task_list, task_data["order"]))
+                self.task_list.setCurrentItem(self.current_task)
+                return
+        if item is None:
+            self.add_task_to_ui(task_data, self.row_for_order(self.task_list, task_data["order"]))
+            return
+        widget = self.task_list.itemWidget(item)
+        self.set_widget_state(widget, task_data["text"], task_data.get("completed", False))
+        widget.update_meta(task_data)
+    
+    def set_widget_state(self, widget, text, is_checked):
+        # 屏蔽信号，避免外部数据触发状态修改和保存
+        widget.checkbox.blockSignals(True)
+        widget.checkbox.setChecked(is_checked)
+        widget.checkbox.blockSignals(False)
+        if widget.text_label.isReadOnly():
+            widget.text_label.setText(text)
+            widget.original_text = text
+        widget.update_style(is_checked)
+    
+    def row_for_order(self, list_widget, order):
+        """二分查找排序键对应的插入行"""
+        low, high = 0, list_widget.count()
+        while low < high:
+            middle = (low + high) // 2
+            if list_widget.item(middle).data(ORDER_ROLE) <= order:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+    
+    def add_task_to_ui(self, task_data, row=None):
+        """在主任务列表中添加一行，row 为None时添加到末尾"""
+        item = QListWidgetItem()
+        item.setData(ID_ROLE, task_data["id"])
+        item.setData(ORDER_ROLE, task_data["order"])
+        if row is None:
+            self.task_list.addItem(item)
+        else:
+            self.task_list.insertItem(row, item)
+        self.set_task_widget(item, task_data)
+        self.task_items[task_data["id"]] = item
+        return item
+    
+    def set_task_widget(self, item, task_data):
+        task_id = task_data["id"]
+        task_widget = TaskItem(task_data["text"], task_id, task_data.get("completed", False))
+        task_widget.update_meta(task_data)
+        item.setSizeHint(task_widget.sizeHint())
+        task_widget.listWidgetItem = item
+        
+        # 连接所有信号
+        task_widget.deleted.connect(self.delete_task)
+        task_widget.edited.connect(self.edit_task)
+        task_widget.statusChanged.connect(self.update_task_status)
+        task_widget.focusOut.connect(self.save_tasks)
+        task_widget.clicked.connect(self.show_subtasks)
+        
+        self.task_list.setItemWidget(item, task_widget)
+    
+    def on_task_rows_moved(self, parent, start, end, destination, row):
+        """拖拽主任务后只更新被移动任务的排序键"""
+        new_row = row if row < start else row - (end - start + 1)
+        item = self.task_list.item(new_row)
+        task_data = self.reorder_row(self.task_list, new_row, self.tasks_data["tasks"])
+        if self.task_list.itemWidget(item) is None:
+            self.set_task_widget(item, task_data)
+        self.save_tasks()
+    
+    def on_subtask_moved(self, subtask, before, after):
+        """拖拽子任务后只更新被移动子任务的排序键"""
+        parent = self.task_index.parent(subtask)
+        move_between(subtask, before, after, parent["subtasks"], self.get_current_time())
+        self.save_tasks()
+    
+    def reorder_row(self, list_widget, row, records):
+        """根据前后相邻行计算被移动记录的新排序键，返回该记录"""
+        record = self.task_index.get(list_widget.item(row).data(ID_ROLE))
+        before = self.task_index.get(list_widget.item(row - 1).data(ID_ROLE)) if row > 0 else None
+        after = (self.task_index.get(list_widget.item(row + 1).data(ID_ROLE))
+                 if row + 1 < list_widget.count() else None)
+        if move_between(record, before, after, records, self.get_current_time()):
+            # 间隔用尽时整体重排，同步所有行上的排序键
+            for r in range(list_widget.count()):
+                item = list_widget.item(r)
+                item.setData(ORDER_ROLE, self.task_index.get(item.data(ID_ROLE))["order"])
+        else:
+            list_widget.item(row).setData(ORDER_ROLE, record["order"])
+        return record
     
     def add_task(self):
         task_text = self.task_input.text().strip()
         if task_text:
             current_time = self.get_current_time()
-            item = QListWidgetItem(self.task_list)
             task_id = self.get_next_task_id()
-            task_widget = TaskItem(task_text, task_id)
-            item.setSizeHint(task_widget.sizeHint())
-            task_widget.listWidgetItem = item
             
-            # 连接所有信号
-            task_widget.deleted.connect(self.delete_task)
-            task_widget.edited.connect(self.edit_task)
-            task_widget.statusChanged.connect(self.update_task_status)
-            task_widget.focusOut.connect(self.save_tasks)
-            task_widget.clicked.connect(self.show_subtasks)
-            
-            # 新的任务数据结构
-            task_data = {
-                "id": task_id,
-                "text": task_text,
-                "completed": False,
-                "hidden": False,
-                "created_at": current_time,
-                "updated_at": current_time,
-                "subtasks": []  # 子任务列表，每个子任务都是完整的任务数据结构
-            }
+            task_data = new_task(task_id, task_text, current_time,
+                                 next_order(self.tasks_data["tasks"]))
             self.tasks_data["tasks"].append(task_data)
+            self.task_index.add(task_data)
             
-            self.task_list.addItem(item)
-            self.task_list.setItemWidget(item, task_widget)
+            self.add_task_to_ui(task_data)
             self.task_input.clear()
             self.save_tasks()
+            # 用户通常会紧接着点击AI生成，提前在后台请求
+            self.ai_prefetcher.prefetch(task_id, task_text)
     
     def edit_task(self, item, new_text):
         widget = self.task_list.itemWidget(item)
@@ -446,6 +1391,7 @@ class AITodoApp(QMainWindow):
                     current_time = self.get_current_time()
                     task["text"] = new_text
                     task["updated_at"] = current_time
+                    self.ai_prefetcher.invalidate(task["id"])
                     
                     # 如果当前正在显示这个任务，更新任务信息
                     if self.current_task == item:
@@ -471,38 +1417,20 @@ class AITodoApp(QMainWindow):
             task_id = widget.task_id
             current_time = self.get_current_time()
             
-            for task in self.tasks_data["tasks"]:
-                if task["id"] == task_id:
-                    # 更新主任务状态
-                    task["completed"] = is_checked
-                    task["updated_at"] = current_time
-
-                    # 检查所有未隐藏的子任务状态
-                    visible_subtasks = [s for s in task["subtasks"] if not s.get("hidden", False)]
-                    all_completed = bool(visible_subtasks and all(s.get("completed", False) for s in visible_subtasks))
-                    
-                    if is_checked or all_completed:
-                        # 同步更新所有未隐藏的子任务状态
-                        for subtask in task.get("subtasks", []):
-                            if not subtask.get("hidden", False):
-                                subtask["completed"] = is_checked
-                                subtask["updated_at"] = current_time
-                    
-                    # 更新主任务UI
-                    widget.checkbox.setChecked(is_checked)
-                    widget.update_style(is_checked)
-                    
-                    # 如果当前正在显示这个任务的子任务，更新子任务显���
-                    if self.current_task == item:
-                        # 保存当前的信息文本
-                        current_info = self.task_info_area.toPlainText()
-                        self.show_subtasks(item)  # 这会刷新子任务显示
-                        # 恢复信息文本，但更新修改时间
-                        info_lines = current_info.split('\n')
-                        if len(info_lines) >= 3:
-                            info_lines[2] = f"修改时间：{current_time}"
-                        self.task_info_area.setText('\n'.join(info_lines))
-                    break
+            task = self.task_index.get(task_id)
+            if task:
+                # 更新主任务状态，并同步未隐藏的各级子任务
+                changed = self.task_index.set_completed(task, is_checked, current_time)
+                self.update_reminders([task] + changed)
+                
+                # 更新主任务UI
+                widget.checkbox.setChecked(is_checked)
+                widget.update_style(is_checked)
+                
+                # 如果当前正在显示这个任务的子任务，刷新已加载的子任务行
+                if self.current_task == item:
+                    self.subtask_model.refresh_all()
+                    self.update_task_info()
             
             self.save_tasks()
     
@@ -510,8 +1438,12 @@ class AITodoApp(QMainWindow):
         item = self.task_list.itemAt(position)
         if item:
             menu = QMenu()
+            task = self.task_index.get(self.task_list.itemWidget(item).task_id)
+            properties_action = QAction("优先级和截止时间...", self)
+            properties_action.triggered.connect(lambda: self.edit_task_properties(task))
             delete_action = QAction("删除", self)
             delete_action.triggered.connect(lambda: self.delete_task(item))
+            menu.addAction(properties_action)
             menu.addAction(delete_action)
             menu.exec(self.task_list.viewport().mapToGlobal(position))
 
@@ -536,142 +1468,157 @@ class AITodoApp(QMainWindow):
                         f"修改时间：{task_data['updated_at']}")
             self.task_info_area.setText(info_text)
             
-            # 清空并重新显示子任务
-            self.subtasks_list.clear()
-            for subtask in task_data.get("subtasks", []):
-                if subtask and not subtask.get("hidden", False):
-                    item = QListWidgetItem(self.subtasks_list)
-                    subtask_widget = TaskItem(subtask["text"], subtask["id"], 
-                                            subtask.get("completed", False))
-                    item.setSizeHint(subtask_widget.sizeHint())
-                    subtask_widget.listWidgetItem = item
-                    
-                    # 直接连接信号，不使用 lambda 或 partial
-                    subtask_widget.deleted.connect(self.delete_subtask)
-                    subtask_widget.edited.connect(self.edit_subtask)
-                    subtask_widget.statusChanged.connect(self.update_subtask_status)
-                    subtask_widget.focusOut.connect(self.save_tasks)
-                    
-                    self.subtasks_list.addItem(item)
-                    self.subtasks_list.setItemWidget(item, subtask_widget)
+            # 子任务树只加载第一层，下级子任务在展开时加载
+            self.subtask_model.set_task(task_data)
+            
+            # 还没有子任务时预取AI拆分结果，每个任务只预取一次
+            if not self.task_index.has_visible_children(task_data):
+                self.ai_prefetcher.prefetch(task_id, task_data["text"])
     
-    def generate_subtasks(self):
+    def generate_subtasks(self, record=None):
+        """为当前主任务（或子任务树中指定的子任务）生成下级子任务"""
         if not self.current_task:
             QMessageBox.warning(self, "警告", "请先选择一个任务！")
             return
-            
-        task_widget = self.task_list.itemWidget(self.current_task)
-        task_text = task_widget.text_label.text()
-        task_id = task_widget.task_id
+        if not record:
+            record = self.task_index.get(self.task_list.itemWidget(self.current_task).task_id)
+        record_id = record["id"]
         
-        try:
-            # 调用DeepSeek API
-            headers = {
-                "Authorization": f"Bearer {self.config['api_key']}",
-                "Content-Type": "application/json"
-            }
-            
-            data = {
-                "model": "deepseek-chat",
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": f"请将这个任务拆分成具体的子任务步骤（用数字编号）：{task_text}"
-                    }
-                ],
-                "temperature": 0.7
-            }
-            
-            response = requests.post(
-                self.config['api_endpoint'],
-                headers=headers,
-                json=data
-            )
-            response.raise_for_status()
-            result = response.json()
-            subtasks_text = result['choices'][0]['message']['content']
-            
-            # 解析子任务文本
-            current_time = self.get_current_time()
-            subtask_lines = [line.strip() for line in subtasks_text.split('\n') if line.strip()]
-            
-            # 添加新的子任务
-            for line in subtask_lines:
-                if line:
-                    subtask_id = self.get_next_subtask_id(task_id)
-                    subtask_data = {
-                        "id": subtask_id,
-                        "text": line,
-                        "completed": False,
-                        "hidden": False,
-                        "created_at": current_time,
-                        "updated_at": current_time
-                    }
-                    
-                    # 添加到主任务的子任务列表中
-                    for task in self.tasks_data["tasks"]:
-                        if task["id"] == task_id:
-                            task["subtasks"].append(subtask_data)
-                            task["updated_at"] = current_time
-                            break
-            
-            # 保存并更新显示
-            self.save_tasks()
-            self.show_subtasks(self.current_task)
-            
-        except Exception as e:
-            QMessageBox.critical(self, "错误", f"生成子任务失败：{str(e)}")
+        # 已有预取结果时立即使用，否则交给调度器排队调用DeepSeek API，
+        # 同一任务重复点击只会请求一次
+        self.statusBar().showMessage("正在生成子任务...")
+        self.ai_prefetcher.request(
+            record_id, record["text"],
+            lambda lines, error: self.subtasksGenerated.emit(record_id, lines, error))
+    
+    def on_subtasks_generated(self, record_id, subtask_lines, error):
+        """AI生成完成后添加子任务"""
+        self.statusBar().clearMessage()
+        if error:
+            QMessageBox.critical(self, "错误", f"生成子任务失败：{str(error)}")
+            return
+        
+        record = self.task_index.get(record_id)
+        if record is None:
+            return
+        self.add_subtasks_to(record, subtask_lines)
+    
+    def add_subtasks_to(self, record, texts):
+        """为任意层级的记录追加子任务，保存并增量更新界面"""
+        current_time = self.get_current_time()
+        added = self.task_index.add_subtasks(record, texts, current_time)
+        # 新增未完成的子任务后，已完成的父任务要改回未完成
+        changed = self.task_index.set_completed(added[0], False, current_time) if added else []
+        self.save_tasks()
+        
+        root = self.subtask_model.root
+        if root is not None and root.record["id"] == root_id_of(record["id"]):
+            self.subtask_model.insert_records(record, added)
+            self.refresh_changed_records(changed)
+            self.update_task_info()
+        else:
+            self.refresh_changed_records(changed)
+        self.update_reminders(changed)
+    
+    def export_tasks(self):
+        """导出任务到CSV、JSON Lines或Markdown文件"""
+        dialog = ExportDialog(self)
+        if dialog.exec() != QDialog.DialogCode.Accepted:
+            return
+        fmt = dialog.export_format()
+        path, _ = QFileDialog.getSaveFileName(self, "导出任务", f"tasks.{fmt}", EXPORT_FORMATS[fmt])
+        if not path:
+            return
+        
+        # 导出线程直接遍历当前任务列表，不复制数据
+        self.export_worker = ExportWorker(self.tasks_data["tasks"], path, fmt, dialog.filters(), self)
+        self.export_worker.progress.connect(
+            lambda done, total: self.statusBar().showMessage(f"正在导出：{done}/{total}"))
+        self.export_worker.succeeded.connect(
+            lambda count: self.statusBar().showMessage(f"导出完成，共 {count} 条记录", 5000))
+        self.export_worker.failed.connect(self.on_export_failed)
+        self.export_button.setEnabled(False)
+        self.export_worker.finished.connect(lambda: self.export_button.setEnabled(True))
+        self.export_worker.start()
+    
+    def show_ai_stats(self):
+        StatsDialog(self.config, self).exec()
+    
+    def on_export_failed(self, message):
+        self.statusBar().clearMessage()
+        QMessageBox.critical(self, "错误", f"导出失败：{message}")
+    
+    def import_tasks(self):
+        """从JSON Lines、CSV或Markdown清单批量导入任务"""
+        path, selected_filter = QFileDialog.getOpenFileName(
+            self, "导入任务", "", ";;".join(IMPORT_FORMATS.values()))
+        if not path:
+            return
+        fmt = os.path.splitext(path)[1].lstrip('.').lower()
+        if fmt not in IMPORT_FORMATS:
+            fmt = next(f for f, name in IMPORT_FORMATS.items() if name == selected_filter)
+        
+        self.import_worker = ImportWorker(path, fmt, self)
+        self.import_worker.progress.connect(
+            lambda count: self.statusBar().showMessage(f"正在解析：{count} 个任务"))
+        self.import_worker.succeeded.connect(self.on_import_parsed)
+        self.import_worker.failed.connect(self.on_import_failed)
+        self.import_button.setEnabled(False)
+        self.import_worker.finished.connect(lambda: self.import_button.setEnabled(True))
+        self.import_worker.start()
+    
+    def on_import_parsed(self, batches):
+        """分配ID并逐批写入任务数据，只保存一次，界面行分批插入"""
+        count = 0
+        for batch in append_batches(self.tasks_data["tasks"], batches):
+            for task in batch:
+                self.task_index.add(task)
+            self.pending_rows.extend(task for task in batch if not task["hidden"])
+            count += len(batch)
+        if count:
+            self.next_task_id = max(self.next_task_id, self.tasks_data["tasks"][-1]["id"] + 1)
+        self.update_reminders(iter_visible_records(task for batch in batches for task in batch))
+        self.save_tasks()
+        self.statusBar().showMessage(f"导入完成，共 {count} 个任务", 5000)
+        self.row_insert_timer.start(0)
+    
+    def on_import_failed(self, message):
+        self.statusBar().clearMessage()
+        QMessageBox.critical(self, "错误", f"导入失败：{message}")
+    
+    def insert_pending_rows(self):
+        """每次只插入一部分任务行，保持界面响应"""
+        self.task_list.setUpdatesEnabled(False)
+        for _ in range(min(ROW_INSERT_CHUNK, len(self.pending_rows))):
+            task_data = self.pending_rows.popleft()
+            if not task_data.get("hidden", False) and task_data["id"] not in self.task_items:
+                self.add_task_to_ui(task_data)
+        self.task_list.setUpdatesEnabled(True)
+        if not self.pending_rows:
+            self.row_insert_timer.stop()
     
     def load_tasks_to_ui(self):
         """从tasks.json加载任务到界面"""
-        for task_data in self.tasks_data.get("tasks", []):
+        for task_data in sorted_by_order(self.tasks_data.get("tasks", [])):
             # 只加载未隐藏的任务
             if not task_data.get("hidden", False):
-                item = QListWidgetItem(self.task_list)
-                task_id = task_data.get("id", self.get_next_task_id())
-                task_widget = TaskItem(task_data["text"], task_id, task_data.get("completed", False))
-                item.setSizeHint(task_widget.sizeHint())
-                task_widget.listWidgetItem = item
-                task_widget.deleted.connect(self.delete_task)
-                task_widget.edited.connect(self.edit_task)
-                task_widget.statusChanged.connect(self.update_task_status)
-                task_widget.focusOut.connect(self.save_tasks)
-                task_widget.clicked.connect(self.show_subtasks)
-                self.task_list.addItem(item)
-                self.task_list.setItemWidget(item, task_widget)
+                task_id = task_data.setdefault("id", self.get_next_task_id())
+                self.add_task_to_ui(task_data)
                 
                 # 更新next_task_id
                 self.next_task_id = max(self.next_task_id, task_id + 1)
     
     def get_next_task_id(self):
         """获取下一个主任务ID"""
-        # 获取所有主任务的ID
-        task_ids = [task["id"] for task in self.tasks_data["tasks"]]
-        if task_ids:
-            self.next_task_id = max(task_ids) + 1
+        if self.tasks_data["tasks"]:
+            self.next_task_id = new_task_id(self.tasks_data["tasks"])
         current_id = self.next_task_id
         self.next_task_id += 1
         return current_id
 
-    def get_next_subtask_id(self, task_id):
-        """获取指定主任务下的下一个子任务ID"""
-        # 找到当前主任务
-        for task in self.tasks_data["tasks"]:
-            if task["id"] == task_id:
-                # 获取所有未隐藏的子任务ID
-                subtask_ids = [subtask["id"] for subtask in task.get("subtasks", [])]
-                # 如果没有子任务，从1开始
-                if not subtask_ids:
-                    return f"{task_id}-1"
-                # 获取最后一个子任务的编号
-                last_id = max([int(sid.split('-')[1]) for sid in subtask_ids])
-                # 返回下一个编号
-                return f"{task_id}-{last_id + 1}"
-        return f"{task_id}-1"  # 如果找不到主任务，从1开始
-
     def get_current_time(self):
         """获取当前时间的格式化字符串"""
-        return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        return get_current_time()
 
     def add_subtask(self):
         """手动添加子任务"""
@@ -682,166 +1629,79 @@ class AITodoApp(QMainWindow):
         subtask_text = self.subtask_input.text().strip()
         if not subtask_text:
             return
-            
-        current_time = self.get_current_time()
-        task_widget = self.task_list.itemWidget(self.current_task)
-        task_id = task_widget.task_id
-        subtask_id = self.get_next_subtask_id(task_id)
-        
-        # 创建新的子任务数据
-        subtask_data = {
-            "id": subtask_id,
-            "text": subtask_text,
-            "completed": False,
-            "hidden": False,
-            "created_at": current_time,
-            "updated_at": current_time
-        }
         
         # 添加到主任务的子任务列表中
-        for task in self.tasks_data["tasks"]:
-            if task["id"] == task_id:
-                task["subtasks"].append(subtask_data)
-                task["updated_at"] = current_time
-                break
-        
-        # 更新显示
-        self.save_tasks()
-        self.show_subtasks(self.current_task)
+        task = self.task_index.get(self.task_list.itemWidget(self.current_task).task_id)
+        self.add_subtasks_to(task, [subtask_text])
         self.subtask_input.clear()
 
-    def update_subtask_status(self, item, is_checked):
-        """更新子任务状态"""
-        if not self.current_task:
+    def show_subtask_context_menu(self, position):
+        """子任务右键菜单：添加下级子任务、AI生成下级子任务、优先级和截止时间、删除"""
+        record = self.subtask_model.record_at(self.subtask_tree.indexAt(position))
+        if record is None:
             return
-            
-        # 获取 TaskItem 部件
-        subtask_widget = self.subtasks_list.itemWidget(item)
-        if subtask_widget:
-            task_widget = self.task_list.itemWidget(self.current_task)
-            task_id = task_widget.task_id
-            subtask_id = subtask_widget.task_id
-            current_time = self.get_current_time()
-            
-            # 更新数据结构中的状态
-            for task in self.tasks_data["tasks"]:
-                if task["id"] == task_id:
-                    # 更新子任务状态
-                    for subtask in task["subtasks"]:
-                        if subtask["id"] == subtask_id:
-                            subtask["completed"] = is_checked
-                            subtask["updated_at"] = current_time
-                            break
-                    
-                    # 检查所有未隐藏的子任务状态
-                    visible_subtasks = [s for s in task["subtasks"] if not s.get("hidden", False)]
-                    all_completed = bool(visible_subtasks and all(s.get("completed", False) for s in visible_subtasks))
-                    
-                    # 更新主任务状态
-                    task["completed"] = all_completed
-                    task["updated_at"] = current_time
-                    
-                    # 更新主任务UI
-                    task_widget.checkbox.setChecked(all_completed)
-                    task_widget.update_style(all_completed)
-                    
-                    # 更新任务信息显示
-                    current_info = self.task_info_area.toPlainText()
-                    info_lines = current_info.split('\n')
-                    if len(info_lines) >= 3:
-                        info_lines[2] = f"修改时间：{current_time}"
-                    self.task_info_area.setText('\n'.join(info_lines))
-                    break
-            
-            # 更新子任务UI
-            subtask_widget.update_style(is_checked)
-            self.save_tasks()
-            self.show_subtasks(self.current_task)
+        menu = QMenu()
+        add_action = QAction("添加下级子任务", self)
+        add_action.triggered.connect(lambda: self.add_nested_subtask(record))
+        generate_action = QAction("AI生成下级子任务", self)
+        generate_action.triggered.connect(lambda: self.generate_subtasks(record))
+        properties_action = QAction("优先级和截止时间...", self)
+        properties_action.triggered.connect(lambda: self.edit_task_properties(record))
+        delete_action = QAction("删除", self)
+        delete_action.triggered.connect(lambda: self.delete_subtask(record))
+        menu.addAction(add_action)
+        menu.addAction(generate_action)
+        menu.addAction(properties_action)
+        menu.addAction(delete_action)
+        menu.exec(self.subtask_tree.viewport().mapToGlobal(position))
 
-    def delete_subtask(self, item):
+    def add_nested_subtask(self, record):
+        text, ok = QInputDialog.getText(self, "添加下级子任务", f"{record['text']} 的子任务：")
+        if ok and text.strip():
+            self.add_subtasks_to(record, [text.strip()])
+            self.subtask_tree.expand(self.subtask_model.index_of(
+                self.subtask_model.node_for_record(record)))
+
+    def refresh_changed_records(self, records):
+        """状态被连带修改的记录：主任务刷新列表行，子任务刷新树中已加载的行"""
+        for record in records:
+            if isinstance(record["id"], int):
+                self.refresh_task_row(record)
+            else:
+                self.subtask_model.refresh_record(record)
+
+    def update_subtask_status(self, subtask, is_checked):
+        """更新子任务状态，同步下级子任务并沿祖先链更新父任务状态"""
+        changed = self.task_index.set_completed(subtask, is_checked, self.get_current_time())
+        self.subtask_model.refresh_record(subtask)
+        self.refresh_changed_records(changed)
+        self.update_reminders([subtask] + changed)
+        self.update_task_info()
+        self.save_tasks()
+
+    def delete_subtask(self, subtask):
         """删除（隐藏）子任务"""
-        if not self.current_task:
-            return
-            
-        # 获取 TaskItem 部件
-        subtask_widget = self.subtasks_list.itemWidget(item)
-        if subtask_widget:
-            task_widget = self.task_list.itemWidget(self.current_task)
-            task_id = task_widget.task_id
-            subtask_id = subtask_widget.task_id
-            
-            # 更新数据
-            for task in self.tasks_data["tasks"]:
-                if task["id"] == task_id:
-                    for subtask in task["subtasks"]:
-                        if subtask["id"] == subtask_id:
-                            subtask["hidden"] = True
-                            subtask["updated_at"] = self.get_current_time()
-                            break
-                    task["updated_at"] = self.get_current_time()
-                    break
-            
-            # 更新UI
-            self.save_tasks()
-            self.show_subtasks(self.current_task)
+        self.task_index.hide(subtask, self.get_current_time())
+        self.ai_prefetcher.invalidate(subtask["id"])
+        self.forget_reminders(subtask)
+        self.subtask_model.remove_record(subtask)
+        self.update_task_info()
+        self.save_tasks()
 
-    def edit_subtask(self, item, new_text):
+    def edit_subtask(self, subtask, new_text):
         """编辑子任务"""
-        if not self.current_task:
-            return
-            
-        # 获取 TaskItem 部件
-        subtask_widget = self.subtasks_list.itemWidget(item)
-        if subtask_widget:
-            task_widget = self.task_list.itemWidget(self.current_task)
-            task_id = task_widget.task_id
-            subtask_id = subtask_widget.task_id
-            
-            # 更新数据
-            for task in self.tasks_data["tasks"]:
-                if task["id"] == task_id:
-                    for subtask in task["subtasks"]:
-                        if subtask["id"] == subtask_id:
-                            subtask["text"] = new_text
-                            subtask["updated_at"] = self.get_current_time()
-                            break
-                    task["updated_at"] = self.get_current_time()
-                    break
-            
-            # 更新UI
-            subtask_widget.text_label.setText(new_text)
-            subtask_widget.update_style(subtask_widget.checkbox.isChecked())
-            self.save_tasks()
-            self.show_subtasks(self.current_task)
+        current_time = self.get_current_time()
+        subtask["text"] = new_text
+        subtask["updated_at"] = current_time
+        self.ai_prefetcher.invalidate(subtask["id"])
+        self.task_index.parent(subtask)["updated_at"] = current_time
+        self.subtask_model.refresh_record(subtask)
+        self.update_task_info()
+        self.save_tasks()
 
     def clean_data_for_save(self):
         """清理数据，确保只保存基本数据类"""
-        clean_tasks = []
-        for task in self.tasks_data["tasks"]:
-            clean_task = {
-                "id": task["id"],
-                "text": task["text"],
-                "completed": task.get("completed", False),
-                "hidden": task.get("hidden", False),
-                "created_at": task["created_at"],
-                "updated_at": task["updated_at"],
-                "subtasks": []
-            }
-            
-            for subtask in task.get("subtasks", []):
-                if isinstance(subtask, dict):
-                    clean_subtask = {
-                        "id": subtask["id"],
-                        "text": subtask["text"],
-                        "completed": subtask.get("completed", False),
-                        "hidden": subtask.get("hidden", False),
-                        "created_at": subtask.get("created_at", self.get_current_time()),
-                        "updated_at": subtask.get("updated_at", self.get_current_time())
-                    }
-                    clean_task["subtasks"].append(clean_subtask)
-            
-            clean_tasks.append(clean_task)
-        return clean_tasks
+        return clean_tasks(self.tasks_data["tasks"], self.get_current_time())
 
     def update_task_info(self):
         """更新右侧的主任务信息"""
@@ -858,28 +1718,34 @@ class AITodoApp(QMainWindow):
 
     def delete_task(self, item):
         """处理任务删除"""
-        row = self.task_list.row(item)
         widget = self.task_list.itemWidget(item)
         task_id = widget.task_id
         
         # 更新任务状态为隐藏
-        for task in self.tasks_data["tasks"]:
-            if task["id"] == task_id:
-                task["hidden"] = True
-                task["updated_at"] = self.get_current_time()
-                break
+        task = self.task_index.get(task_id)
+        if task:
+            self.task_index.hide(task, self.get_current_time())
+            self.ai_prefetcher.invalidate(task_id)
+            self.forget_reminders(task)
+        
+        self.delete_task_row(item)
+        
+        # 保存更改
+        self.save_tasks()
+    
+    def delete_task_row(self, item):
+        """从主任务列表中移除一行"""
+        widget = self.task_list.itemWidget(item)
+        self.task_items.pop(widget.task_id, None)
         
         # 从列表中移除显示
-        self.task_list.takeItem(row)
+        self.task_list.takeItem(self.task_list.row(item))
         
         # 清除当前选中状态
         if self.current_task == item:
             self.current_task = None
-            self.subtasks_list.clear()
+            self.subtask_model.set_task(None)
             self.task_info_area.clear()
-        
-        # 保存更改
-        self.save_tasks()
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
@@ -0,0 +1,259 @@
+import threading
+
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("urllib3")
+
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError  # noqa: E402
+
+import todo_ai  # noqa: E402
+from todo_ai import (AIBudgetExceeded, AIScheduler, PRIORITY_BACKGROUND,  # noqa: E402
+                     PRIORITY_INTERACTIVE, Prefetcher, TokenUsage)
+from todo_telemetry import TelemetryStore, iter_records  # noqa: E402
+
+
+def response(text, total_tokens=10):
+    return {
+        "choices": [{"message": {"content": text}}],
+        "usage": {"prompt_tokens": total_tokens // 2, "completion_tokens": total_tokens // 2,
+                  "total_tokens": total_tokens},
+    }
+
+
+class FakeSend:
+    """记录发出的请求；第一个请求阻塞到 release()，以便在队列中积压请求"""
+
+    def __init__(self):
+        self.sent = []
+        self.started = threading.Event()
+        self.gate = threading.Event()
+
+    def __call__(self, config, task_text, timings=None):
+        self.sent.append(task_text)
+        self.started.set()
+        self.gate.wait(5)
+        timings.update(status=200, total_ms=1.0)
+        return response(f"{task_text} 1\n{task_text} 2\n")
+
+    def release(self):
+        self.gate.set()
+
+
+@pytest.fixture
+def make_scheduler(tmp_path):
+    def make(send, **config):
+        config = dict({"ai_max_concurrency": 1, "ai_requests_per_minute": 0}, **config)
+        return AIScheduler(config, send=send,
+                           usage=TokenUsage(str(tmp_path / "ai_usage.json")),
+                           telemetry=TelemetryStore(str(tmp_path / "ai_telemetry.jsonl")))
+    return make
+
+
+def collect(results, key, done):
+    def callback(lines, error):
+        results.append((key, lines, error))
+        done.release()
+    return callback
+
+
+def wait(done, count):
+    for _ in range(count):
+        assert done.acquire(timeout=5)
+
+
+def test_interactive_requests_run_first(make_scheduler):
+    send = FakeSend()
+    scheduler = make_scheduler(send)
+    results, done = [], threading.Semaphore(0)
+    scheduler.submit("busy", "busy", collect(results, "busy", done))
+    assert send.started.wait(5)
+
+    scheduler.submit(1, "background", collect(results, 1, done), PRIORITY_BACKGROUND)
+    scheduler.submit(2, "interactive", collect(results, 2, done), PRIORITY_INTERACTIVE)
+    scheduler.submit(3, "promoted", collect(results, 3, done), PRIORITY_BACKGROUND)
+    assert scheduler.promote(3, PRIORITY_INTERACTIVE)
+    send.release()
+    wait(done, 4)
+
+    assert send.sent == ["busy", "interactive", "promoted", "background"]
+    assert results[1] == (2, ["interactive 1", "interactive 2"], None)
+
+
+def test_duplicate_requests_are_coalesced(make_scheduler):
+    send = FakeSend()
+    scheduler = make_scheduler(send)
+    results, done = [], threading.Semaphore(0)
+    scheduler.submit("busy", "busy", collect(results, "busy", done))
+    assert send.started.wait(5)
+
+    scheduler.submit(1, "same", collect(results, "first", done))
+    scheduler.submit(1, "same", collect(results, "second", done))
+    scheduler.submit(2, "cancelled", collect(results, 2, done))
+    assert scheduler.cancel(2)
+    send.release()
+    wait(done, 3)
+
+    assert send.sent == ["busy", "same"]
+    assert sorted(key for key, _, _ in results[1:]) == ["first", "second"]
+
+
+def test_budget_refuses_without_sending(make_scheduler, tmp_path):
+    send = FakeSend()
+    send.release()
+    scheduler = make_scheduler(send, ai_daily_token_budget=15)
+    assert scheduler.call(1, "task") == ["task 1", "task 2"]
+    assert scheduler.call(2, "task") == ["task 1", "task 2"]
+    assert scheduler.usage.today() == 20
+
+    with pytest.raises(AIBudgetExceeded):
+        scheduler.call(3, "task")
+    assert len(send.sent) == 2
+    # 被预算拒绝的请求没有发出，不计入调用统计
+    records = list(iter_records(str(tmp_path / "ai_telemetry.jsonl")))
+    assert len(records) == 2
+    assert all(record["status"] == 200 for record in records)
+
+
+def test_token_usage_sees_other_processes(tmp_path):
+    path = str(tmp_path / "ai_usage.json")
+    gui, cli = TokenUsage(path), TokenUsage(path)
+    gui.add(100)
+    cli.add(50)
+    assert gui.today() == 150
+    gui.add(10)
+    assert cli.today() == 160
+
+
+class FlakyConnection:
+    """按顺序对每个地址抛出给定的异常，None 表示连接成功"""
+
+    def __init__(self, outcomes):
+        self.host = self._dns_host = "api.example.com"
+        self.port = 443
+        self.outcomes = list(outcomes)
+        self.tried = []
+
+    def connect(self):
+        self.tried.append(self._dns_host)
+        error = self.outcomes.pop(0)
+        if error is not None:
+            raise error
+
+
+class TimedFlakyConnection(todo_ai._TimedConnectionMixin, FlakyConnection):
+    pass
+
+
+@pytest.fixture
+def two_addresses(monkeypatch):
+    calls = []
+
+    def getaddrinfo(host, port, type=0):
+        calls.append(host)
+        return [(0, type, 0, "", ("2001:db8::1", port)), (0, type, 0, "", ("192.0.2.1", port))]
+
+    monkeypatch.setattr(todo_ai.socket, "getaddrinfo", getaddrinfo)
+    return calls
+
+
+@pytest.mark.parametrize("error", [ConnectTimeoutError("timeout"),
+                                   NewConnectionError(None, "refused")])
+def test_connect_resolves_once_and_tries_next_address(two_addresses, error):
+    connection = TimedFlakyConnection([error, None])
+    connection.connect()
+    assert two_addresses == ["api.example.com"]
+    assert connection.tried == ["2001:db8::1", "192.0.2.1"]
+    assert connection._dns_host == "api.example.com"
+    assert set(connection.timings) == {"dns_ms", "connect_ms"}
+
+
+def test_connect_raises_after_last_address(two_addresses):
+    connection = TimedFlakyConnection([ConnectTimeoutError("a"), ConnectTimeoutError("b")])
+    with pytest.raises(ConnectTimeoutError):
+        connection.connect()
+    assert connection._dns_host == "api.example.com"
+
+
+class FakeScheduler:
+    """记录提交、提升和取消，由测试决定请求何时完成"""
+
+    def __init__(self):
+        self.submitted = {}  # key -> [task_text, callback, priority]
+        self.promoted = []
+        self.cancelled = []
+
+    def submit(self, key, task_text, callback, priority=PRIORITY_BACKGROUND):
+        self.submitted[key] = [task_text, callback, priority]
+
+    def promote(self, key, priority):
+        self.promoted.append((key, priority))
+        self.submitted[key][2] = priority
+        return True
+
+    def cancel(self, key):
+        self.cancelled.append(key)
+        return self.submitted.pop(key, None) is not None
+
+    def finish(self, key, lines, error=None):
+        _, callback, _ = self.submitted.pop(key)
+        callback(lines, error)
+
+
+def test_prefetched_suggestion_is_used_on_request():
+    scheduler = FakeScheduler()
+    prefetcher = Prefetcher(scheduler, enabled=True)
+    assert prefetcher.prefetch(1, "写周报")
+    assert not prefetcher.prefetch(1, "写周报")
+    assert scheduler.submitted[1][2] == PRIORITY_BACKGROUND
+    scheduler.finish(1, ["a", "b"])
+
+    results = []
+    prefetcher.request(1, "写周报", lambda lines, error: results.append((lines, error)))
+    assert results == [(["a", "b"], None)]
+    assert scheduler.submitted == {}
+
+    # 建议只使用一次，再次请求时正常提交
+    prefetcher.request(1, "写周报", lambda lines, error: None)
+    assert scheduler.submitted[1][2] == PRIORITY_INTERACTIVE
+
+
+def test_disabled_prefetcher_does_nothing():
+    scheduler = FakeScheduler()
+    assert not Prefetcher(scheduler, enabled=False).prefetch(1, "写周报")
+    assert scheduler.submitted == {}
+
+
+def test_in_flight_prefetch_is_promoted():
+    scheduler = FakeScheduler()
+    prefetcher = Prefetcher(scheduler, enabled=True)
+    prefetcher.prefetch(1, "写周报")
+
+    results = []
+    prefetcher.request(1, "写周报", lambda lines, error: results.append(lines))
+    assert scheduler.promoted == [(1, PRIORITY_INTERACTIVE)]
+    assert results == []
+    scheduler.finish(1, ["a"])
+    assert results == [["a"]]
+
+
+def test_edit_invalidates_and_cancels():
+    scheduler = FakeScheduler()
+    prefetcher = Prefetcher(scheduler, enabled=True, daily_limit=1)
+    prefetcher.prefetch(1, "写周报")
+
+    prefetcher.invalidate(1)
+    assert scheduler.cancelled == [1]
+    # 取消的预取不计入每日次数，修改后的内容可以重新预取
+    assert prefetcher.prefetch(1, "写月报")
+    scheduler.finish(1, ["old"])
+
+    prefetcher.request(1, "写年报", lambda lines, error: None)
+    assert scheduler.submitted[1][:1] == ["写年报"]
+
+
+def test_daily_limit_is_enforced():
+    scheduler = FakeScheduler()
+    prefetcher = Prefetcher(scheduler, enabled=True, daily_limit=2)
+    assert [prefetcher.prefetch(key, f"任务{key}") for key in range(3)] == [True, True, False]
+    assert sorted(scheduler.submitted) == [0, 1]
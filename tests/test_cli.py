@@ -0,0 +1,103 @@
+import io
+import json
+
+import pytest
+
+import todo_cli
+from todo_store import read_tasks
+
+
+@pytest.fixture
+def run(tmp_path, capsys, monkeypatch):
+    path = str(tmp_path / "tasks.json")
+
+    def run(*argv, stdin=""):
+        monkeypatch.setattr("sys.stdin", io.StringIO(stdin))
+        status = todo_cli.main(["--file", path, *argv])
+        out, err = capsys.readouterr()
+        return status, out, err
+
+    run.path = path
+    return run
+
+
+def tasks(path):
+    return read_tasks(path)["tasks"]
+
+
+def test_nested_ids_and_completion(run):
+    assert run("add", "写周报")[:2] == (0, "1\n")
+    assert run("add", "--parent", "1", "收集进展")[1] == "1-1\n"
+    assert run("add", "--parent", "1-1", "问小王")[1] == "1-1-1\n"
+    assert run("add", "--parent", "1", "发送邮件")[1] == "1-2\n"
+
+    assert run("done", "1-1")[0] == 0
+    task = tasks(run.path)[0]
+    first, second = task["subtasks"]
+    assert first["completed"] and first["subtasks"][0]["completed"]
+    assert not second["completed"] and not task["completed"]
+
+    status, out, _ = run("list")
+    assert status == 0
+    assert out.splitlines() == ["[ ] 1  写周报", "    [x] 1-1  收集进展", "        [x] 1-1-1  问小王",
+                                "    [ ] 1-2  发送邮件"]
+
+
+def test_unknown_id_is_an_error(run):
+    status, _, err = run("done", "7")
+    assert status == 1 and "找不到任务" in err
+
+
+def test_batch_saves_successes_and_reports_failures(run):
+    status, out, err = run("batch", stdin="add a\nadd --parent 1 b\ndone 99\nbogus\nadd c\n")
+    assert status == 1
+    assert out.split() == ["1", "1-1", "2"]
+    assert "第3行" in err and "第4行" in err and "2 条命令执行失败" in err
+    assert [task["text"] for task in tasks(run.path)] == ["a", "c"]
+
+    assert run("batch", stdin="add d\n")[0] == 0
+
+
+def test_save_merges_external_changes(run, monkeypatch):
+    run("add", "a")
+    load = todo_cli.load
+
+    def load_then_modify(path):
+        loaded = load(path)
+        # 读取之后、保存之前另一个进程追加了任务
+        data = read_tasks(path)
+        data["tasks"].append({"id": 9, "text": "external", "updated_at": "2024-11-01 10:00:00"})
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        return loaded
+
+    monkeypatch.setattr(todo_cli, "load", load_then_modify)
+    assert run("add", "b")[0] == 0
+    assert sorted(task["text"] for task in tasks(run.path)) == ["a", "b", "external"]
+
+
+
+def test_external_deletion_is_not_undone(run, monkeypatch):
+    run("batch", stdin="add a\nadd b\n")
+    load = todo_cli.load
+
+    def load_then_delete(path):
+        loaded = load(path)
+        data = read_tasks(path)
+        data["tasks"] = [task for task in data["tasks"] if task["text"] != "a"]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        return loaded
+
+    monkeypatch.setattr(todo_cli, "load", load_then_delete)
+    assert run("add", "c")[0] == 0
+    visible = [task["text"] for task in tasks(run.path) if not task["hidden"]]
+    assert visible == ["b", "c"]
+
+
+@pytest.mark.parametrize("content", ["{\"tasks\": [", "[]"])
+def test_unreadable_file_is_reported(run, content):
+    with open(run.path, "w", encoding="utf-8") as f:
+        f.write(content)
+    status, _, err = run("list")
+    assert status == 1 and "无法读取任务文件" in err
@@ -0,0 +1,92 @@
+import pytest
+
+from todo_export import export_tasks
+from todo_import import import_tasks
+from todo_store import ORDER_STEP, TaskIndex, move_between, new_task
+
+NOW = "2024-11-01 10:00:00"
+
+
+def sample_tasks():
+    first = new_task(1, "写周报", NOW, ORDER_STEP)
+    second = new_task(2, "整理数据", NOW, 2 * ORDER_STEP)
+    second.update(priority=3, due="2024-11-08 18:00:00")
+    index = TaskIndex([first, second])
+    step, _ = index.add_subtasks(first, ["收集进展", "发送邮件"], NOW)
+    index.add_subtasks(step, ["问小王"], NOW)
+    index.set_completed(step, True, NOW)
+    tasks = [first, second]
+    # 拖动后第二个任务排在前面，导出按显示顺序
+    move_between(second, None, first, tasks, NOW)
+    return tasks
+
+
+def outline(tasks, depth=0):
+    """按顺序列出 (层级, 文本, 完成, 优先级, 截止时间)"""
+    result = []
+    for record in sorted(tasks, key=lambda r: r["order"]):
+        result.append((depth, record["text"], record["completed"], record.get("priority", 0),
+                       record.get("due")))
+        result.extend(outline(record.get("subtasks", []), depth + 1))
+    return result
+
+
+@pytest.mark.parametrize("fmt", ["jsonl", "csv"])
+def test_round_trip(tmp_path, fmt):
+    tasks = sample_tasks()
+    path = str(tmp_path / f"tasks.{fmt}")
+    assert export_tasks(tasks, path, fmt) == 5
+
+    data = {"tasks": []}
+    assert import_tasks(data, path, fmt, batch_size=1) == 2
+    assert outline(data["tasks"]) == outline(tasks)
+    assert [task["id"] for task in data["tasks"]] == [1, 2]
+    assert data["tasks"][1]["subtasks"][0]["subtasks"][0]["id"] == "2-1-1"
+
+
+def test_markdown_round_trip_keeps_structure(tmp_path):
+    tasks = sample_tasks()
+    path = str(tmp_path / "tasks.md")
+    export_tasks(tasks, path, "md")
+
+    data = {"tasks": [new_task(7, "已有任务", NOW, ORDER_STEP)]}
+    assert import_tasks(data, path, "md") == 2
+    imported = outline(data["tasks"])[1:]
+    assert [(d, text, done) for d, text, done, _, _ in imported] == \
+        [(d, text, done) for d, text, done, _, _ in outline(tasks)]
+    assert [task["id"] for task in data["tasks"]] == [7, 8, 9]
+
+
+def test_export_filters_completed_subtrees(tmp_path):
+    path = str(tmp_path / "tasks.md")
+    assert export_tasks(sample_tasks(), path, "md", include_completed=False) == 3
+
+
+def test_subtasks_attach_to_parent_id_in_any_order(tmp_path):
+    path = tmp_path / "tasks.csv"
+    path.write_text("type,id,parent_id,text\n"
+                    "task,1,,任务\n"
+                    "subtask,1-1,1,步骤一\n"
+                    "subtask,1-2,1,步骤二\n"
+                    "subtask,1-1-1,1-1,步骤一的细节\n"
+                    "subtask,x,99,找不到父任务\n"
+                    "task,2,,另一个任务\n"
+                    "subtask,2-1,1,不属于当前主任务\n", encoding="utf-8")
+    data = {"tasks": []}
+    assert import_tasks(data, str(path), "csv") == 2
+
+    first, second = data["tasks"]
+    assert [s["text"] for s in first["subtasks"]] == ["步骤一", "步骤二", "找不到父任务"]
+    assert [s["text"] for s in first["subtasks"][0]["subtasks"]] == ["步骤一的细节"]
+    assert first["subtasks"][1]["subtasks"] == []
+    assert first["subtasks"][0]["subtasks"][0]["id"] == "1-1-1"
+    assert [s["text"] for s in second["subtasks"]] == ["不属于当前主任务"]
+
+
+def test_failed_import_is_rolled_back(tmp_path):
+    path = tmp_path / "tasks.jsonl"
+    path.write_text('{"text": "a"}\n{"text": "b"}\nnot json\n', encoding="utf-8")
+    data = {"tasks": [new_task(1, "已有任务", NOW, ORDER_STEP)]}
+    with pytest.raises(ValueError):
+        import_tasks(data, str(path), "jsonl", batch_size=1)
+    assert [task["text"] for task in data["tasks"]] == ["已有任务"]
@@ -0,0 +1,66 @@
+from todo_reminders import DueQueue
+
+
+def record(record_id, due, completed=False, hidden=False, subtasks=()):
+    return {"id": record_id, "due": due, "completed": completed, "hidden": hidden,
+            "subtasks": list(subtasks)}
+
+
+def test_from_tasks_skips_completed_hidden_and_undated():
+    tasks = [
+        record(1, "2024-11-03 09:00:00", subtasks=[
+            record("1-1", "2024-11-01 09:00:00"),
+            record("1-2", "2024-11-01 08:00:00", completed=True),
+        ]),
+        record(2, None),
+        record(3, "2024-11-02 09:00:00", hidden=True, subtasks=[record("3-1", "2024-11-01 07:00:00")]),
+    ]
+    queue = DueQueue.from_tasks(tasks)
+    assert len(queue) == 2
+    assert queue.nsmallest(5) == [("2024-11-01 09:00:00", "1-1"), ("2024-11-03 09:00:00", 1)]
+
+
+def test_pop_until_returns_due_entries_in_order():
+    queue = DueQueue()
+    queue.push(1, "2024-11-03 00:00:00")
+    queue.push(2, "2024-11-01 00:00:00")
+    queue.push(3, "2024-11-02 00:00:00")
+    assert queue.pop_until("2024-11-02 00:00:00") == [("2024-11-01 00:00:00", 2),
+                                                      ("2024-11-02 00:00:00", 3)]
+    assert queue.peek() == ("2024-11-03 00:00:00", 1)
+    assert 2 not in queue
+
+
+def test_reschedule_and_complete_replace_old_entries():
+    queue = DueQueue()
+    task = record(1, "2024-11-01 00:00:00")
+    other = record(2, "2024-11-02 00:00:00")
+    queue.update(task)
+    queue.update(other)
+
+    task["due"] = "2024-11-05 00:00:00"
+    queue.update(task)
+    assert queue.peek() == ("2024-11-02 00:00:00", 2)
+
+    other["completed"] = True
+    queue.update(other)
+    assert len(queue) == 1
+    assert queue.pop_until("2024-12-01 00:00:00") == [("2024-11-05 00:00:00", 1)]
+    assert queue.peek() is None
+
+
+def test_heap_is_compacted_after_many_reschedules():
+    queue = DueQueue()
+    for minute in range(1000):
+        queue.push(1, f"2024-11-01 00:{minute % 60:02d}:{minute // 60:02d}")
+    assert len(queue) == 1
+    assert len(queue._heap) <= 2 * len(queue) + 65
+
+
+def test_copy_is_independent():
+    queue = DueQueue()
+    queue.push(1, "2024-11-01 00:00:00")
+    copy = queue.copy()
+    copy.pop_until("2024-11-02 00:00:00")
+    copy.push(2, "2024-11-03 00:00:00")
+    assert queue.nsmallest(5) == [("2024-11-01 00:00:00", 1)]
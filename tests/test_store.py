@@ -0,0 +1,243 @@
+import json
+import os
+import stat
+import threading
+import time
+
+import pytest
+
+from todo_store import (ORDER_STEP, TaskIndex, add_subtasks, ensure_order, file_lock,
+                        merge_tasks, move_between, new_task, order_of, read_tasks,
+                        record_ids, sorted_by_order, write_tasks)
+
+NOW = "2024-11-01 10:00:00"
+LATER = "2024-11-02 10:00:00"
+
+
+def make_tasks(*texts):
+    return [new_task(number, text, NOW, number * ORDER_STEP)
+            for number, text in enumerate(texts, 1)]
+
+
+def texts(records):
+    return [record["text"] for record in sorted_by_order(records)]
+
+
+class TestEnsureOrder:
+    def test_legacy_list_is_numbered_by_position(self):
+        tasks = [{"id": 1, "text": "a"}, {"id": 2, "text": "b", "subtasks": [{"id": "2-1"}]}]
+        assert ensure_order(tasks)
+        assert [task["order"] for task in tasks] == [ORDER_STEP, 2 * ORDER_STEP]
+        assert tasks[1]["subtasks"][0]["order"] == ORDER_STEP
+
+    def test_partial_keys_keep_saved_order(self):
+        tasks = make_tasks("a", "b", "c")
+        # 拖动后 c 排在最前，外部脚本又追加了一条没有 order 的任务
+        tasks[2]["order"] = 1.0
+        tasks.append({"id": 4, "text": "d"})
+        assert ensure_order(tasks)
+        assert texts(tasks) == ["c", "a", "b", "d"]
+        assert tasks[2]["order"] == 1.0
+
+    def test_unchanged_when_complete(self):
+        tasks = make_tasks("a", "b")
+        assert not ensure_order(tasks)
+
+
+class TestMergeTasks:
+    def test_newer_remote_fields_win(self):
+        local = {"tasks": make_tasks("a")}
+        remote = {"tasks": [dict(make_tasks("a")[0], text="a2", updated_at=LATER)]}
+        assert merge_tasks(local, remote) == [(1, None)]
+        assert local["tasks"][0]["text"] == "a2"
+
+    def test_older_remote_is_ignored(self):
+        local = {"tasks": [dict(make_tasks("a")[0], updated_at=LATER)]}
+        remote = {"tasks": [dict(make_tasks("a")[0], text="old")]}
+        assert merge_tasks(local, remote) == []
+        assert local["tasks"][0]["text"] == "a"
+
+    def test_new_records_are_appended(self):
+        local = {"tasks": make_tasks("a", "local only")}
+        remote_task = make_tasks("a")[0]
+        add_subtasks(remote_task, ["s1"], NOW)
+        remote_task["subtasks"][0].pop("order")
+        remote = {"tasks": [remote_task, {"id": 3, "text": "new", "updated_at": NOW}]}
+
+        changes = merge_tasks(local, remote)
+
+        assert sorted(changes, key=str) == [(1, "1-1"), (3, None)]
+        assert texts(local["tasks"]) == ["a", "local only", "new"]
+        assert local["tasks"][0]["subtasks"][0]["order"] == ORDER_STEP
+
+    def test_malformed_records_are_skipped(self):
+        local = {"tasks": make_tasks("a")}
+        remote = {"tasks": [
+            {"text": "buy milk"},
+            "not a record",
+            dict(make_tasks("a")[0], updated_at=None, text="stale"),
+            {"id": 2, "text": "new", "priority": 99, "order": "x",
+             "subtasks": [{"id": "2-1", "text": "ok"}, {"id": "9-1", "text": "wrong parent"}, None]},
+        ]}
+
+        assert merge_tasks(local, remote) == [(2, None)]
+
+        first, second = local["tasks"]
+        assert first["text"] == "a"
+        assert second["priority"] == 0 and second["order"] == 2 * ORDER_STEP
+        assert second["created_at"] and second["updated_at"]
+        assert [s["id"] for s in second["subtasks"]] == ["2-1"]
+        assert second["subtasks"][0]["order"] == ORDER_STEP
+
+    def test_newer_remote_with_bad_field_types(self):
+        local = {"tasks": make_tasks("a")}
+        remote = {"tasks": [dict(make_tasks("a")[0], text="a2", completed="yes", priority=7,
+                                 updated_at=LATER)]}
+        assert merge_tasks(local, remote) == [(1, None)]
+        task = local["tasks"][0]
+        assert (task["text"], task["completed"], task["priority"]) == ("a2", False, 0)
+
+    def test_records_removed_from_file_are_hidden(self):
+        local = {"tasks": make_tasks("a", "b")}
+        add_subtasks(local["tasks"][0], ["s1", "s2"], NOW)
+        saved = record_ids(local["tasks"])
+        # 保存后本地又新增了一个任务，外部脚本删除了任务2和子任务1-1
+        local["tasks"].append(new_task(3, "unsaved", NOW, 3 * ORDER_STEP))
+        remote_task = make_tasks("a")[0]
+        add_subtasks(remote_task, ["s1", "s2"], NOW)
+        del remote_task["subtasks"][0]
+
+        changes = merge_tasks(local, {"tasks": [remote_task]}, saved)
+
+        assert sorted(changes, key=str) == [(1, "1-1"), (2, None)]
+        first, second, unsaved = local["tasks"]
+        assert second["hidden"] and first["subtasks"][0]["hidden"]
+        assert not first["hidden"] and not first["subtasks"][1]["hidden"]
+        assert not unsaved["hidden"]
+
+    def test_without_saved_ids_local_records_are_kept(self):
+        local = {"tasks": make_tasks("a")}
+        assert merge_tasks(local, {"tasks": []}) == []
+        assert not local["tasks"][0]["hidden"]
+
+    @pytest.mark.parametrize("remote", [[], {"tasks": {}}, "tasks"])
+    def test_bad_root_is_rejected(self, remote):
+        local = {"tasks": make_tasks("a")}
+        with pytest.raises(ValueError):
+            merge_tasks(local, remote)
+        assert texts(local["tasks"]) == ["a"]
+
+    def test_read_rejects_bad_root(self, tmp_path):
+        path = tmp_path / "tasks.json"
+        path.write_text("[]")
+        with pytest.raises(ValueError):
+            read_tasks(str(path))
+
+
+class TestTaskIndex:
+    def setup_method(self):
+        self.tasks = make_tasks("a")
+        self.index = TaskIndex(self.tasks)
+        self.task = self.tasks[0]
+        self.first, self.second = self.index.add_subtasks(self.task, ["s1", "s2"], NOW)
+
+    def test_counts_follow_completion(self):
+        assert self.index.counts[1] == [2, 0]
+        assert self.index.set_completed(self.first, True, NOW) == []
+        assert self.index.counts[1] == [2, 1]
+        assert not self.task["completed"]
+
+    def test_last_child_completes_parent(self):
+        self.index.set_completed(self.first, True, NOW)
+        assert self.index.set_completed(self.second, True, NOW) == [self.task]
+        assert self.task["completed"]
+
+    def test_checking_parent_cascades(self):
+        changed = self.index.set_completed(self.task, True, NOW)
+        assert {record["id"] for record in changed} == {"1-1", "1-2"}
+        assert self.index.counts[1] == [2, 2]
+
+    def test_re_adding_a_task_recounts_its_subtree(self):
+        # 外部合并直接修改了记录，重新登记后计数与数据一致
+        self.first["completed"] = True
+        self.second["hidden"] = True
+        self.index.add(self.task)
+        assert self.index.counts[1] == [1, 1]
+        assert self.index.all_children_completed(self.task)
+
+    def test_hide_updates_counts(self):
+        self.index.set_completed(self.first, True, NOW)
+        self.index.hide(self.first, NOW)
+        assert self.index.counts[1] == [1, 0]
+
+
+class TestMoveBetween:
+    def test_moves_only_the_record(self):
+        tasks = make_tasks("a", "b", "c")
+        a, b, c = tasks
+        assert not move_between(c, a, b, tasks, LATER)
+        assert texts(tasks) == ["a", "c", "b"]
+        assert c["updated_at"] == LATER and a["updated_at"] == NOW
+
+    def test_moves_to_either_end(self):
+        tasks = make_tasks("a", "b", "c")
+        move_between(tasks[2], None, tasks[0], tasks, LATER)
+        move_between(tasks[1], tasks[0], None, tasks, LATER)
+        assert texts(tasks) == ["c", "a", "b"]
+
+    def test_rebalances_when_gap_is_too_small(self):
+        tasks = make_tasks("a", "b", "c")
+        a, b, c = tasks
+        b["order"] = order_of(a) + 1e-9
+        assert move_between(c, a, b, tasks, LATER)
+        assert texts(tasks) == ["a", "c", "b"]
+        assert order_of(c) - order_of(a) > 1
+
+
+class TestFiles:
+    @pytest.mark.skipif(os.name == "nt", reason="需要符号链接和POSIX权限")
+    def test_write_keeps_mode_and_symlink(self, tmp_path):
+        target = tmp_path / "real.json"
+        target.write_text('{"tasks": []}')
+        os.chmod(target, 0o640)
+        link = tmp_path / "tasks.json"
+        link.symlink_to(target)
+
+        write_tasks(str(link), {"tasks": make_tasks("a")})
+
+        assert link.is_symlink()
+        assert stat.S_IMODE(target.stat().st_mode) == 0o640
+        assert texts(read_tasks(str(link))["tasks"]) == ["a"]
+        assert json.loads(target.read_text())["tasks"][0]["text"] == "a"
+
+    @pytest.mark.skipif(os.name == "nt", reason="需要POSIX权限")
+    def test_new_file_follows_umask(self, tmp_path):
+        path = tmp_path / "tasks.json"
+        old = os.umask(0o027)
+        try:
+            write_tasks(str(path), {"tasks": []})
+        finally:
+            os.umask(old)
+        assert stat.S_IMODE(path.stat().st_mode) == 0o640
+        assert [p.name for p in tmp_path.iterdir()] == ["tasks.json"]
+
+    def test_lock_is_reentrant_per_thread(self, tmp_path):
+        path = str(tmp_path / "tasks.json")
+        events = []
+
+        def worker(name):
+            with file_lock(path):
+                with file_lock(path):
+                    events.append(("enter", name))
+                    time.sleep(0.01)
+                    events.append(("leave", name))
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(events) == 8
+        for start in range(0, 8, 2):
+            assert events[start][1] == events[start + 1][1]
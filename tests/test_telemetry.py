@@ -0,0 +1,60 @@
+import json
+import os
+import stat
+from datetime import date, timedelta
+
+import pytest
+
+from todo_telemetry import TelemetryStore, format_summary, iter_records, percentile, summarize
+
+
+def test_percentile_uses_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert percentile([7], 99) == 7
+    assert percentile([], 50) is None
+
+
+def test_summarize_groups_by_day():
+    records = [
+        {"time": "2024-11-01 09:00:00", "status": 200, "total_ms": 100.0, "ttfb_ms": 80.0,
+         "prompt_tokens": 1000, "completion_tokens": 500, "subtasks": 4},
+        {"time": "2024-11-01 10:00:00", "status": 200, "total_ms": 300.0,
+         "prompt_tokens": 1000, "completion_tokens": 500, "subtasks": 3},
+        {"time": "2024-11-02 09:00:00", "status": 429, "error": "HTTPError", "total_ms": 50.0},
+    ]
+    summary = summarize(records, prompt_price=2.0, completion_price=8.0)
+
+    overall = summary["overall"]
+    assert (overall["calls"], overall["failures"], overall["subtasks"]) == (3, 1, 7)
+    assert overall["cost"] == pytest.approx((2000 * 2.0 + 1000 * 8.0) / 1_000_000)
+    assert overall["latency_ms"]["total_ms"] == {"p50": 100.0, "p95": 300.0, "p99": 300.0}
+    assert overall["latency_ms"]["dns_ms"]["p50"] is None
+    assert [(day["date"], day["calls"]) for day in summary["days"]] == \
+        [("2024-11-01", 2), ("2024-11-02", 1)]
+    assert summary["status_codes"] == {"200": 2, "429": 1}
+    assert summary["errors"] == {"HTTPError": 1}
+    assert "合计" in format_summary(summary)
+
+
+def test_store_prunes_expired_records(tmp_path):
+    path = tmp_path / "ai_telemetry.jsonl"
+    old = (date.today() - timedelta(days=10)).isoformat()
+    recent = (date.today() - timedelta(days=1)).isoformat()
+    path.write_text(json.dumps({"time": f"{old} 09:00:00"}) + "\n" +
+                    json.dumps({"time": f"{recent} 09:00:00"}) + "\n" +
+                    "truncated line\n", encoding="utf-8")
+    if os.name != "nt":
+        os.chmod(path, 0o644)
+
+    store = TelemetryStore(str(path), retention_days=3)
+    store.record({"status": 200})
+    store.record({"status": 500})
+
+    days = [record["time"][:10] for record in iter_records(str(path))]
+    assert days == [recent, date.today().isoformat(), date.today().isoformat()]
+    assert [r["status"] for r in iter_records(str(path), since=date.today().isoformat())] == [200, 500]
+    if os.name != "nt":
+        assert stat.S_IMODE(path.stat().st_mode) == 0o644
@@ -0,0 +1,473 @@
+"""DeepSeek API 调用：将任务拆分成子任务步骤，并通过调度器控制并发、速率和每日Token用量（不依赖Qt）"""
+import heapq
+import itertools
+import json
+import socket
+import threading
+import time
+from datetime import date
+from functools import partial
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+from todo_store import file_lock
+from todo_telemetry import TelemetryStore, DEFAULT_RETENTION_DAYS, LATENCY_FIELDS
+
+
+# 优先级数值越小越先执行
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+DEFAULT_MAX_CONCURRENCY = 2
+DEFAULT_REQUESTS_PER_MINUTE = 20
+DEFAULT_PREFETCH_DAILY_LIMIT = 50
+USAGE_FILE = 'ai_usage.json'
+
+
+class AIBudgetExceeded(Exception):
+    pass
+
+
+def parse_subtask_lines(text):
+    """将AI返回的文本按行拆分为子任务"""
+    return [line.strip() for line in text.split('\n') if line.strip()]
+
+
+def _elapsed_ms(start, end=None):
+    return round(((end or time.perf_counter()) - start) * 1000, 1)
+
+
+class _TimedConnectionMixin:
+    """新建连接时分别记录DNS解析和建立连接（TCP + TLS）的时间"""
+    timings = None
+
+    def connect(self):
+        host = self._dns_host
+        start = time.perf_counter()
+        addresses = list(dict.fromkeys(
+            info[4][0] for info in socket.getaddrinfo(host, self.port, type=socket.SOCK_STREAM)))
+        resolved = time.perf_counter()
+        # 只解析一次：直接连接解析出的地址，依次尝试直到成功；
+        # TLS 证书校验和 SNI 使用的是 self.host，不受影响
+        try:
+            for address in addresses:
+                self._dns_host = address
+                try:
+                    super().connect()
+                    break
+                except (NewConnectionError, ConnectTimeoutError):
+                    # 与 urllib3 自己的连接循环一致：拒绝连接或超时都换下一个地址
+                    if address == addresses[-1]:
+                        raise
+        finally:
+            self._dns_host = host
+        self.timings = {"dns_ms": _elapsed_ms(start, resolved), "connect_ms": _elapsed_ms(resolved)}
+
+
+class _TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _TimedAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _get_session():
+    """所有请求共用一个会话，复用已建立的连接"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = _TimedAdapter()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+        return _session
+
+
+def request_completion(config, task_text, timeout=60, timings=None):
+    """调用DeepSeek API，返回完整的响应数据（包含 usage）
+
+    传入 timings 字典时写入各阶段耗时（毫秒）和HTTP状态码，请求失败时也会写入已完成的部分。
+    """
+    if timings is None:
+        timings = {}
+    headers = {
+        "Authorization": f"Bearer {config['api_key']}",
+        "Content-Type": "application/json"
+    }
+
+    data = {
+        "model": "deepseek-chat",
+        "messages": [
+            {
+                "role": "user",
+                "content": f"请将这个任务拆分成具体的子任务步骤（用数字编号）：{task_text}"
+            }
+        ],
+        "temperature": 0.7
+    }
+
+    start = time.perf_counter()
+    try:
+        # 先只读取响应头，以便区分首字节时间和读取响应体的时间
+        response = _get_session().post(
+            config['api_endpoint'],
+            headers=headers,
+            json=data,
+            timeout=timeout,
+            stream=True
+        )
+        timings["ttfb_ms"] = _elapsed_ms(start)
+        timings["status"] = response.status_code
+        # 复用的连接没有新的连接耗时
+        connection = response.raw.connection
+        timings.update(getattr(connection, "timings", None) or {"dns_ms": 0.0, "connect_ms": 0.0})
+        if connection is not None:
+            connection.timings = None
+        try:
+            response.raise_for_status()
+            return response.json()
+        finally:
+            response.close()
+    finally:
+        timings["total_ms"] = _elapsed_ms(start)
+
+
+class TokenUsage:
+    """按天累计的Token用量，保存在 ai_usage.json 中，多个进程共享"""
+
+    def __init__(self, path=USAGE_FILE):
+        self.path = path
+        self.day = None
+        self.used = 0
+        self._lock = threading.Lock()
+        data = self._read()
+        self.day = data.get("date")
+        self.used = data.get("total_tokens", 0)
+        self._roll_over()
+
+    def _read(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def _roll_over(self):
+        today = date.today().isoformat()
+        if self.day != today:
+            self.day = today
+            self.used = 0
+
+    def _sync(self):
+        """合并其他进程记录的当天用量，调用时需持有锁"""
+        data = self._read()
+        self._roll_over()
+        if data.get("date") == self.day:
+            self.used = max(self.used, data.get("total_tokens", 0))
+
+    def today(self):
+        """当天已用的Token数，包括其他进程（如命令行 gen）的用量"""
+        with self._lock, file_lock(self.path):
+            self._sync()
+            return self.used
+
+    def add(self, tokens):
+        with self._lock, file_lock(self.path):
+            # 先读取其他进程记录的用量再累加
+            self._sync()
+            self.used += tokens
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump({"date": self.day, "total_tokens": self.used}, f)
+
+
+class _Job:
+    def __init__(self, key, task_text, priority):
+        self.key = key
+        self.task_text = task_text
+        self.priority = priority
+        self.callbacks = []
+        self.cancelled = False
+
+
+class AIScheduler:
+    """AI请求调度器
+
+    - 优先队列：交互请求（立即生成）排在后台请求之前
+    - 并发上限：ai_max_concurrency 个工作线程
+    - 速率限制：每分钟 ai_requests_per_minute 个请求的令牌桶
+    - 每日预算：根据响应中的 usage 累计Token，超过 ai_daily_token_budget 后拒绝请求（0 表示不限制）
+    - 同一任务尚未发出的重复请求合并为一个
+    - 每次调用的耗时、Token用量、状态码和异常类型记录到 ai_telemetry.jsonl
+
+    回调 callback(lines, error) 在工作线程中调用。
+    send(config, task_text, timings=...) 返回响应数据，并把各阶段耗时写入 timings。
+    """
+
+    def __init__(self, config, send=request_completion, usage=None, telemetry=None):
+        self.config = config
+        self.send = send
+        self.max_concurrency = max(1, int(config.get("ai_max_concurrency", DEFAULT_MAX_CONCURRENCY)))
+        # 每秒补充的令牌数，0 表示不限制速率
+        self.rate = float(config.get("ai_requests_per_minute", DEFAULT_REQUESTS_PER_MINUTE)) / 60
+        self.daily_token_budget = int(config.get("ai_daily_token_budget", 0))
+        self.usage = usage if usage is not None else TokenUsage()
+        self.telemetry = telemetry if telemetry is not None else TelemetryStore(
+            retention_days=int(config.get("ai_telemetry_days", DEFAULT_RETENTION_DAYS)))
+
+        self._condition = threading.Condition()
+        self._queue = []  # [priority, seq, job]
+        self._pending = {}  # key -> 尚未发出的 job
+        self._seq = itertools.count()
+        self._tokens = max(1.0, self.rate * 60)
+        self._capacity = self._tokens
+        self._last_refill = time.monotonic()
+        self._workers = []
+
+    def submit(self, key, task_text, callback, priority=PRIORITY_BACKGROUND):
+        """提交请求；同一 key 已在排队时只追加回调，并按需提升优先级"""
+        with self._condition:
+            job = self._pending.get(key)
+            if job is None:
+                job = _Job(key, task_text, priority)
+                self._pending[key] = job
+                heapq.heappush(self._queue, [priority, next(self._seq), job])
+            elif priority < job.priority:
+                # 旧的队列项留在堆中，出队时按优先级不一致跳过
+                job.priority = priority
+                job.task_text = task_text
+                heapq.heappush(self._queue, [priority, next(self._seq), job])
+            job.callbacks.append(callback)
+            self._ensure_workers()
+            self._condition.notify()
+        return job
+
+    def promote(self, key, priority):
+        """提升尚未发出的请求的优先级，返回是否提升"""
+        with self._condition:
+            job = self._pending.get(key)
+            if job is None or priority >= job.priority:
+                return False
+            job.priority = priority
+            heapq.heappush(self._queue, [priority, next(self._seq), job])
+            self._condition.notify()
+            return True
+    
+    def cancel(self, key):
+        """取消尚未发出的请求，返回是否取消成功"""
+        with self._condition:
+            job = self._pending.pop(key, None)
+            if job is None:
+                return False
+            job.cancelled = True
+            return True
+
+    def call(self, key, task_text, priority=PRIORITY_INTERACTIVE):
+        """同步调用，返回子任务文本列表（命令行模式使用）"""
+        done = threading.Event()
+        outcome = {}
+
+        def callback(lines, error):
+            outcome["lines"], outcome["error"] = lines, error
+            done.set()
+
+        self.submit(key, task_text, callback, priority)
+        done.wait()
+        if outcome["error"]:
+            raise outcome["error"]
+        return outcome["lines"]
+
+    def _ensure_workers(self):
+        while len(self._workers) < self.max_concurrency:
+            worker = threading.Thread(target=self._run, daemon=True)
+            self._workers.append(worker)
+            worker.start()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self._capacity, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def _next_job(self):
+        """等待有请求且令牌可用时取出优先级最高的请求"""
+        with self._condition:
+            while True:
+                while self._queue and (self._queue[0][2].cancelled or
+                                       self._queue[0][0] != self._queue[0][2].priority):
+                    heapq.heappop(self._queue)
+                if not self._queue:
+                    self._condition.wait()
+                    continue
+                if self.rate > 0:
+                    self._refill()
+                    if self._tokens < 1:
+                        self._condition.wait((1 - self._tokens) / self.rate)
+                        continue
+                    self._tokens -= 1
+                job = heapq.heappop(self._queue)[2]
+                del self._pending[job.key]
+                return job
+
+    def _run(self):
+        while True:
+            job = self._next_job()
+            lines, error = None, None
+            timings = {}
+            usage = {}
+            try:
+                if self.daily_token_budget and self.usage.today() >= self.daily_token_budget:
+                    raise AIBudgetExceeded(f"今日AI Token用量已达上限（{self.daily_token_budget}）")
+                result = self.send(self.config, job.task_text, timings=timings)
+                usage = result.get("usage") or {}
+                tokens = usage.get("total_tokens", 0)
+                if tokens:
+                    self.usage.add(tokens)
+                parse_start = time.perf_counter()
+                lines = parse_subtask_lines(result['choices'][0]['message']['content'])
+                timings["parse_ms"] = _elapsed_ms(parse_start)
+            except Exception as e:
+                error = e
+            # 超出每日预算的请求没有发出，不计入调用统计
+            if not isinstance(error, AIBudgetExceeded):
+                self._record(job, timings, usage, lines, error)
+            for callback in job.callbacks:
+                callback(lines, error)
+
+    def _record(self, job, timings, usage, lines, error):
+        status = timings.get("status")
+        response = getattr(error, "response", None)
+        if status is None and response is not None:
+            status = response.status_code
+        entry = {
+            "priority": "interactive" if job.priority <= PRIORITY_INTERACTIVE else "background",
+            "status": status,
+            "error": type(error).__name__ if error else None,
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+            "subtasks": len(lines) if lines else 0,
+        }
+        for field in LATENCY_FIELDS:
+            entry[field] = timings.get(field)
+        try:
+            self.telemetry.record(entry)
+        except OSError:
+            # 统计写入失败不影响生成结果
+            pass
+
+
+class _Prefetch:
+    def __init__(self, task_text):
+        self.task_text = task_text
+        self.lines = None
+        self.done = False
+        self.waiters = []  # 预取尚未完成时用户已经点击了生成
+
+
+class Prefetcher:
+    """后台预取AI拆分结果（ai_prefetch 开启时生效）
+
+    任务新建或首次选中时以后台优先级提交请求，结果作为待用建议保存，
+    用户点击生成时直接使用；预取还在进行时点击生成会提升其优先级并等待结果。
+    任务文本修改后建议作废，尚未发出的预取请求被取消。
+    每天最多预取 ai_prefetch_daily_limit 次（0 表示不限制），同时受调度器的Token预算约束。
+    """
+
+    def __init__(self, scheduler, enabled=False, daily_limit=DEFAULT_PREFETCH_DAILY_LIMIT):
+        self.scheduler = scheduler
+        self.enabled = enabled
+        self.daily_limit = daily_limit
+        self._lock = threading.Lock()
+        self._entries = {}  # key -> _Prefetch
+        self._seen = set()  # 已经预取过的 key，同一任务只预取一次
+        self._day = None
+        self._count = 0
+
+    @classmethod
+    def from_config(cls, scheduler, config):
+        return cls(scheduler, bool(config.get("ai_prefetch", False)),
+                   int(config.get("ai_prefetch_daily_limit", DEFAULT_PREFETCH_DAILY_LIMIT)))
+
+    def prefetch(self, key, task_text):
+        """开始预取，返回是否提交了请求"""
+        with self._lock:
+            if not self.enabled or key in self._seen:
+                return False
+            today = date.today().isoformat()
+            if self._day != today:
+                self._day = today
+                self._count = 0
+            if self.daily_limit and self._count >= self.daily_limit:
+                return False
+            self._count += 1
+            self._seen.add(key)
+            entry = self._entries[key] = _Prefetch(task_text)
+        self.scheduler.submit(key, task_text, partial(self._finished, key, entry), PRIORITY_BACKGROUND)
+        return True
+
+    def _finished(self, key, entry, lines, error):
+        with self._lock:
+            waiters, entry.waiters = entry.waiters, []
+            entry.done = True
+            entry.lines = lines
+            # 失败的预取直接丢弃；已有用户等待时结果交给用户，不再保留
+            if (error or waiters) and self._entries.get(key) is entry:
+                del self._entries[key]
+        for callback in waiters:
+            callback(lines, error)
+
+    def request(self, key, task_text, callback, priority=PRIORITY_INTERACTIVE):
+        """用户请求生成：有对应的预取结果时立即回调，否则正常提交到调度器"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.task_text != task_text:
+                entry = None
+            elif entry is not None and entry.done:
+                del self._entries[key]
+            elif entry is not None:
+                entry.waiters.append(callback)
+        if entry is None:
+            self.invalidate(key)
+            self.scheduler.submit(key, task_text, callback, priority)
+        elif entry.done:
+            callback(entry.lines, None)
+        else:
+            self.scheduler.promote(key, priority)
+
+    def invalidate(self, key):
+        """任务文本修改或任务删除后丢弃预取结果，取消尚未发出的预取请求"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            # 文本改变后允许对新内容重新预取
+            self._seen.discard(key)
+            if entry is None or entry.done or entry.waiters:
+                return
+            if self.scheduler.cancel(key):
+                # 没有发出的请求不计入每日次数
+                self._count = max(0, self._count - 1)
@@ -0,0 +1,348 @@
+"""命令行模式：不导入Qt，直接管理 tasks.json，适合脚本和定时任务
+
+用法示例：
+    python ai_todo.py add 写周报
+    python ai_todo.py add --parent 3 整理本周数据
+    python ai_todo.py add --due "2024-11-08 18:00" --priority 高 提交报告
+    python ai_todo.py set 3-1 --due 2024-11-08
+    python ai_todo.py next
+    python ai_todo.py list
+    python ai_todo.py done 3-1
+    python ai_todo.py rm 3
+    python ai_todo.py gen 3
+    python ai_todo.py export tasks.csv
+    python ai_todo.py stats --json ai_stats.json
+    python ai_todo.py batch < commands.txt   # 每行一条命令，只读写一次文件
+"""
+import argparse
+import json
+import os
+import shlex
+import sys
+
+from todo_store import (file_lock, file_fingerprint, read_tasks, write_tasks, merge_tasks,
+                        get_current_time, new_task_id, new_task, parse_record_id, TaskIndex,
+                        clean_tasks, ensure_order, next_order, sorted_by_order, ORDER_STEP,
+                        PRIORITY_NAMES, parse_priority, normalize_due, set_task_properties,
+                        record_ids)
+
+
+class CommandError(Exception):
+    pass
+
+
+def resolve(index, record_id):
+    """将 "3"、"3-1"、"3-1-2" 形式的ID解析为任务记录"""
+    try:
+        record = index.get(parse_record_id(record_id))
+    except ValueError:
+        raise CommandError(f"无效的任务ID：{record_id}")
+    if record is None:
+        raise CommandError(f"找不到任务：{record_id}")
+    return record
+
+
+def cmd_add(data, args):
+    text = " ".join(args.text).strip()
+    if not text:
+        raise CommandError("任务内容不能为空")
+    current_time = get_current_time()
+    if args.parent:
+        parent = resolve(data["index"], args.parent)
+        record = data["index"].add_subtasks(parent, [text], current_time)[0]
+    else:
+        record = new_task(data["next_id"], text, current_time, data["next_order"])
+        data["next_id"] += 1
+        data["next_order"] += ORDER_STEP
+        data["tasks"].append(record)
+        data["index"].add(record)
+    if args.priority is not None or args.due:
+        set_task_properties(record, args.priority or 0, args.due, current_time)
+    print(record["id"])
+    return True
+
+
+def cmd_set(data, args):
+    """修改优先级或截止时间，未指定的字段保持不变"""
+    record = resolve(data["index"], args.id)
+    priority = args.priority if args.priority is not None else record.get("priority", 0)
+    due = None if args.no_due else (args.due or record.get("due"))
+    set_task_properties(record, priority, due, get_current_time())
+    return True
+
+
+def _describe(record):
+    """优先级和截止时间的简短说明"""
+    parts = []
+    if record.get("priority", 0):
+        parts.append(f"[{PRIORITY_NAMES[record['priority']]}]")
+    if record.get("due"):
+        parts.append(f"截止 {record['due'][:16]}")
+    return ("  " + " ".join(parts)) if parts else ""
+
+
+def _print_tree(record, show_hidden, depth=0):
+    mark = "x" if record.get("completed", False) else " "
+    suffix = "（已删除）" if record.get("hidden", False) else ""
+    print(f"{'    ' * depth}[{mark}] {record['id']}  {record['text']}{_describe(record)}{suffix}")
+    for subtask in sorted_by_order(record.get("subtasks", [])):
+        if show_hidden or not subtask.get("hidden", False):
+            _print_tree(subtask, show_hidden, depth + 1)
+
+
+def cmd_list(data, args):
+    for task in sorted_by_order(data["tasks"]):
+        if task.get("hidden", False) and not args.all:
+            continue
+        if args.todo and task.get("completed", False):
+            continue
+        _print_tree(task, args.all)
+    return False
+
+
+def cmd_next(data, args):
+    """按截止时间列出未完成的任务和子任务"""
+    from todo_reminders import DueQueue
+
+    now = get_current_time()
+    for due, record_id in DueQueue.from_tasks(data["tasks"]).nsmallest(args.limit):
+        record = data["index"].get(record_id)
+        overdue = "（已过期）" if due <= now else ""
+        print(f"{due[:16]}  {record_id}  {record['text']}{overdue}")
+    return False
+
+
+def cmd_done(data, args):
+    current_time = get_current_time()
+    for record_id in args.ids:
+        data["index"].set_completed(resolve(data["index"], record_id), not args.undo, current_time)
+    return True
+
+
+def cmd_rm(data, args):
+    current_time = get_current_time()
+    for record_id in args.ids:
+        data["index"].hide(resolve(data["index"], record_id), current_time)
+    return True
+
+
+_scheduler = None
+
+
+def get_scheduler(config_path):
+    """batch 中的多条 gen 命令共用一个调度器，遵守速率限制和每日预算"""
+    global _scheduler
+    if _scheduler is None:
+        # 只有用到AI时才导入 requests，保证其他命令启动足够快
+        from todo_ai import AIScheduler
+
+        with open(config_path, 'r', encoding='utf-8') as f:
+            _scheduler = AIScheduler(json.load(f))
+    return _scheduler
+
+
+def cmd_gen(data, args):
+    record = resolve(data["index"], args.id)
+    lines = get_scheduler(args.config).call(record["id"], record["text"])
+    for subtask in data["index"].add_subtasks(record, lines, get_current_time()):
+        _print_tree(subtask, False, 1)
+    return True
+
+
+def cmd_export(data, args):
+    from todo_export import export_tasks
+
+    fmt = args.format or os.path.splitext(args.path)[1].lstrip('.').lower()
+    count = export_tasks(data["tasks"], args.path, fmt,
+                         include_hidden=args.include_hidden,
+                         include_completed=not args.no_completed,
+                         start_date=args.since, end_date=args.until)
+    print(f"已导出 {count} 条记录", file=sys.stderr)
+    return False
+
+
+def cmd_import(data, args):
+    from todo_import import import_tasks
+
+    fmt = args.format or os.path.splitext(args.path)[1].lstrip('.').lower()
+    count = import_tasks(data, args.path, fmt)
+    for task in data["tasks"][len(data["tasks"]) - count:]:
+        data["index"].add(task)
+    if count:
+        data["next_id"] = data["tasks"][-1]["id"] + 1
+        data["next_order"] = data["tasks"][-1]["order"] + ORDER_STEP
+    print(f"已导入 {count} 个任务", file=sys.stderr)
+    return count > 0
+
+
+def cmd_stats(data, args):
+    from todo_telemetry import load_summary, format_summary, export_summary
+
+    try:
+        with open(args.config, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        config = {}
+    summary = load_summary(config, since=args.since)
+    print(format_summary(summary))
+    if args.json:
+        export_summary(summary, args.json)
+        print(f"已导出到 {args.json}", file=sys.stderr)
+    return False
+
+
+def cmd_batch(data, args):
+    """从标准输入逐行读取命令，在同一进程内执行，最后只保存一次
+
+    失败的命令不影响其他命令，失败条数记录在 args.failures 中，main 据此返回非0状态。
+    """
+    parser = build_parser(batch=True)
+    modified = False
+    failures = 0
+    for line_number, line in enumerate(sys.stdin, 1):
+        argv = shlex.split(line, comments=True)
+        if not argv:
+            continue
+        try:
+            sub_args = parser.parse_args(argv)
+            sub_args.config = args.config
+            modified = sub_args.func(data, sub_args) or modified
+        except Exception as e:
+            failures += 1
+            print(f"第{line_number}行：{e}", file=sys.stderr)
+        except SystemExit:
+            # argparse 已输出错误信息
+            failures += 1
+            print(f"第{line_number}行：无法解析命令", file=sys.stderr)
+    args.failures = failures
+    if failures:
+        print(f"{failures} 条命令执行失败", file=sys.stderr)
+    return modified
+
+
+def build_parser(batch=False):
+    parser = argparse.ArgumentParser(
+        prog="ai_todo.py",
+        description="AI Todo List 命令行模式",
+        exit_on_error=not batch)
+    if not batch:
+        parser.add_argument('--file', default='tasks.json', help="任务文件（默认 tasks.json）")
+        parser.add_argument('--config', default='config.json', help="配置文件（默认 config.json）")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    add_parser = subparsers.add_parser('add', help="添加任务或子任务")
+    add_parser.add_argument('text', nargs='+', help="任务内容")
+    add_parser.add_argument('--parent', help="父任务ID（如 3 或 3-1），指定时添加为子任务")
+    add_parser.add_argument('--priority', type=parse_priority, help="优先级（0-3 或 无/低/中/高）")
+    add_parser.add_argument('--due', type=normalize_due, help="截止时间（YYYY-MM-DD [HH:MM]）")
+    add_parser.set_defaults(func=cmd_add)
+
+    set_parser = subparsers.add_parser('set', help="设置优先级或截止时间")
+    set_parser.add_argument('id', help="任务ID（如 3）或子任务ID（如 3-1）")
+    set_parser.add_argument('--priority', type=parse_priority, help="优先级（0-3 或 无/低/中/高）")
+    set_parser.add_argument('--due', type=normalize_due, help="截止时间（YYYY-MM-DD [HH:MM]）")
+    set_parser.add_argument('--no-due', action='store_true', help="取消截止时间")
+    set_parser.set_defaults(func=cmd_set)
+
+    next_parser = subparsers.add_parser('next', help="按截止时间列出未完成的任务")
+    next_parser.add_argument('-n', '--limit', type=int, default=20, help="最多显示的条数（默认20）")
+    next_parser.set_defaults(func=cmd_next)
+
+    list_parser = subparsers.add_parser('list', help="列出任务")
+    list_parser.add_argument('--all', action='store_true', help="包含已删除的任务")
+    list_parser.add_argument('--todo', action='store_true', help="只显示未完成的主任务")
+    list_parser.set_defaults(func=cmd_list)
+
+    done_parser = subparsers.add_parser('done', help="标记任务完成")
+    done_parser.add_argument('ids', nargs='+', help="任务ID（如 3）或子任务ID（如 3-1、3-1-2）")
+    done_parser.add_argument('--undo', action='store_true', help="标记为未完成")
+    done_parser.set_defaults(func=cmd_done)
+
+    rm_parser = subparsers.add_parser('rm', help="删除（隐藏）任务")
+    rm_parser.add_argument('ids', nargs='+', help="任务ID（如 3）或子任务ID（如 3-1、3-1-2）")
+    rm_parser.set_defaults(func=cmd_rm)
+
+    gen_parser = subparsers.add_parser('gen', help="AI生成子任务")
+    gen_parser.add_argument('id', help="任务ID（如 3）或子任务ID（如 3-1）")
+    gen_parser.set_defaults(func=cmd_gen)
+
+    export_parser = subparsers.add_parser('export', help="导出任务")
+    export_parser.add_argument('path', help="输出文件，格式由扩展名决定")
+    export_parser.add_argument('--format', choices=['csv', 'jsonl', 'md'])
+    export_parser.add_argument('--include-hidden', action='store_true', help="包含已删除的任务")
+    export_parser.add_argument('--no-completed', action='store_true', help="不包含已完成的任务")
+    export_parser.add_argument('--since', help="创建日期下限（YYYY-MM-DD）")
+    export_parser.add_argument('--until', help="创建日期上限（YYYY-MM-DD）")
+    export_parser.set_defaults(func=cmd_export)
+
+    import_parser = subparsers.add_parser('import', help="批量导入任务")
+    import_parser.add_argument('path', help="输入文件，格式由扩展名决定")
+    import_parser.add_argument('--format', choices=['jsonl', 'csv', 'md'])
+    import_parser.set_defaults(func=cmd_import)
+
+    stats_parser = subparsers.add_parser('stats', help="AI调用统计（延迟百分位数、Token用量和费用）")
+    stats_parser.add_argument('--since', help="只统计该日期及之后的调用（YYYY-MM-DD）")
+    stats_parser.add_argument('--json', help="同时将统计结果导出为JSON文件")
+    stats_parser.set_defaults(func=cmd_stats)
+
+    if not batch:
+        batch_parser = subparsers.add_parser('batch', help="从标准输入批量执行命令")
+        batch_parser.set_defaults(func=cmd_batch)
+    return parser
+
+
+def load(path):
+    """读取任务和文件指纹"""
+    with file_lock(path):
+        fingerprint = file_fingerprint(path)
+        try:
+            return read_tasks(path), fingerprint
+        except ValueError as e:
+            raise CommandError(f"无法读取任务文件 {path}：{e}")
+
+
+def save(path, data, fingerprint, saved_ids):
+    """保存任务，期间如有其他进程写入则先合并
+
+    saved_ids 为读取时文件中的记录ID，合并时据此识别被其他进程删除的记录。
+    """
+    with file_lock(path):
+        current = file_fingerprint(path)
+        if current != fingerprint:
+            try:
+                remote_data = read_tasks(path)
+            except ValueError as e:
+                raise CommandError(f"任务文件 {path} 已被其他程序修改且无法读取，未保存：{e}")
+            merge_tasks(data, remote_data, saved_ids if current is not None else None)
+        write_tasks(path, {"tasks": clean_tasks(data["tasks"], get_current_time())})
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    try:
+        data, fingerprint = load(args.file)
+    except CommandError as e:
+        print(f"错误：{e}", file=sys.stderr)
+        return 1
+    saved_ids = record_ids(data["tasks"])
+    ensure_order(data["tasks"])
+    # 索引和下面的计数器只在内存中使用，保存时只写入任务列表
+    data["index"] = TaskIndex(data["tasks"])
+    # 下一个主任务的ID和排序键只计算一次，batch 中每添加一个任务递增，避免每次都扫描全部任务
+    data["next_id"] = new_task_id(data["tasks"])
+    data["next_order"] = next_order(data["tasks"])
+    try:
+        modified = args.func(data, args)
+        if modified:
+            save(args.file, data, fingerprint, saved_ids)
+    except Exception as e:
+        print(f"错误：{e}", file=sys.stderr)
+        return 1
+    # batch 中部分命令失败时，成功的修改已经保存，但仍返回非0状态
+    return 1 if getattr(args, "failures", 0) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
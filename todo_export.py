@@ -0,0 +1,124 @@
+"""任务导出：以生成器逐条读取任务数据并直接写入文件，内存占用与列表大小无关（不依赖Qt）"""
+import csv
+import json
+
+from todo_store import sorted_by_order
+
+
+EXPORT_FORMATS = {
+    "csv": "CSV (*.csv)",
+    "jsonl": "JSON Lines (*.jsonl)",
+    "md": "Markdown (*.md)",
+}
+
+CSV_FIELDS = ["type", "id", "parent_id", "text", "completed", "hidden", "priority", "due",
+              "created_at", "updated_at"]
+
+# 每处理多少个主任务报告一次进度
+PROGRESS_INTERVAL = 200
+
+
+def _record_matches(record, include_hidden, include_completed, start_date=None, end_date=None):
+    if not include_hidden and record.get("hidden", False):
+        return False
+    if not include_completed and record.get("completed", False):
+        return False
+    created_date = record.get("created_at", "")[:10]
+    if start_date and created_date < start_date:
+        return False
+    if end_date and created_date > end_date:
+        return False
+    return True
+
+
+def iter_records(tasks, include_hidden=False, include_completed=True,
+                 start_date=None, end_date=None, progress=None):
+    """按显示顺序深度优先产出 (parent_id, record, depth)，主任务的 depth 为0
+
+    start_date/end_date 为 "YYYY-MM-DD" 格式，按主任务的创建日期过滤（含边界）。
+    任务被过滤掉时，其下各级子任务也不会导出。
+    """
+    total = len(tasks)
+    # 排序只复制记录的引用，不复制任务数据
+    for index, task in enumerate(sorted_by_order(tasks), 1):
+        if _record_matches(task, include_hidden, include_completed, start_date, end_date):
+            yield None, task, 0
+            # 栈中只保存当前路径上各层尚未输出的兄弟节点
+            stack = [(task["id"], iter(sorted_by_order(task.get("subtasks", []))), 1)]
+            while stack:
+                parent_id, children, depth = stack[-1]
+                subtask = next(children, None)
+                if subtask is None:
+                    stack.pop()
+                    continue
+                if isinstance(subtask, dict) and _record_matches(
+                        subtask, include_hidden, include_completed):
+                    yield parent_id, subtask, depth
+                    stack.append((subtask["id"], iter(sorted_by_order(subtask.get("subtasks", []))),
+                                  depth + 1))
+        if progress and (index % PROGRESS_INTERVAL == 0 or index == total):
+            progress(index, total)
+
+
+def _flat_record(parent_id, record, depth):
+    return {
+        "type": "subtask" if depth else "task",
+        "id": record["id"],
+        "parent_id": parent_id,
+        "text": record["text"],
+        "completed": record.get("completed", False),
+        "hidden": record.get("hidden", False),
+        "priority": record.get("priority", 0),
+        "due": record.get("due") or "",
+        "created_at": record.get("created_at", ""),
+        "updated_at": record.get("updated_at", ""),
+    }
+
+
+def write_csv(f, records):
+    writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+    writer.writeheader()
+    count = 0
+    for parent_id, record, depth in records:
+        writer.writerow(_flat_record(parent_id, record, depth))
+        count += 1
+    return count
+
+
+def write_jsonl(f, records):
+    count = 0
+    for parent_id, record, depth in records:
+        f.write(json.dumps(_flat_record(parent_id, record, depth), ensure_ascii=False))
+        f.write('\n')
+        count += 1
+    return count
+
+
+def write_markdown(f, records):
+    count = 0
+    for parent_id, record, depth in records:
+        indent = "  " * depth
+        mark = "x" if record.get("completed", False) else " "
+        text = " ".join(record["text"].splitlines())
+        f.write(f"{indent}- [{mark}] {text}\n")
+        count += 1
+    return count
+
+
+WRITERS = {
+    "csv": write_csv,
+    "jsonl": write_jsonl,
+    "md": write_markdown,
+}
+
+
+def export_tasks(tasks, path, fmt, progress=None, **filters):
+    """将任务流式导出到文件，返回写入的记录数
+
+    filters 参见 iter_records：include_hidden、include_completed、start_date、end_date
+    """
+    if fmt not in WRITERS:
+        raise ValueError(f"不支持的导出格式：{fmt}")
+    records = iter_records(tasks, progress=progress, **filters)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        return WRITERS[fmt](f, records)
@@ -0,0 +1,197 @@
+"""任务批量导入：逐行解析JSON Lines、CSV和Markdown清单，批量分配ID并写入任务数据（不依赖Qt）"""
+import csv
+import json
+import re
+from datetime import datetime
+
+from todo_store import ORDER_STEP, new_task_id, next_order, parse_priority, normalize_due
+
+
+IMPORT_FORMATS = {
+    "jsonl": "JSON Lines (*.jsonl)",
+    "csv": "CSV (*.csv)",
+    "md": "Markdown (*.md)",
+}
+
+# 每批写入任务数据的主任务数量
+BATCH_SIZE = 1000
+
+_TRUE_VALUES = {"1", "true", "yes", "y", "x", "是"}
+_MARKDOWN_ITEM = re.compile(r'^(\s*)[-*+]\s+(?:\[([ xX])\]\s+)?(.*\S)')
+
+
+def _as_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in _TRUE_VALUES
+    return bool(value)
+
+
+def _depth_of(record, depths):
+    """根据 type 和 parent_id 计算层级（主任务为0）
+
+    depths 记录当前主任务下已出现的ID对应的层级，遇到新的主任务时清空；
+    parent_id 缺失或找不到时作为最近主任务的直接子任务。
+    """
+    if record.get("type", "task") != "subtask":
+        depths.clear()
+        depth = 0
+    else:
+        depth = depths.get(str(record.get("parent_id") or ""), 0) + 1
+    if record.get("id") not in (None, ""):
+        depths[str(record["id"])] = depth
+    return depth
+
+
+def parse_jsonl(f):
+    """产出 (depth, fields)
+
+    每行一个对象；type 为 "subtask" 的行通过 parent_id 挂到前面的任务下，
+    任务行也可以直接包含嵌套的 subtasks 数组。
+    """
+    depths = {}
+    for line in f:
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        depth = _depth_of(record, depths)
+        yield depth, record
+        stack = [(child, depth + 1) for child in reversed(record.get("subtasks", ()))]
+        while stack:
+            child, child_depth = stack.pop()
+            yield child_depth, child
+            stack.extend((c, child_depth + 1) for c in reversed(child.get("subtasks", ())))
+
+
+def parse_csv(f):
+    """产出 (depth, fields)，列名与导出的CSV相同，只有 text 列是必需的"""
+    depths = {}
+    for row in csv.DictReader(f):
+        yield _depth_of(row, depths), row
+
+
+def parse_markdown(f):
+    """产出 (depth, fields)，按缩进确定层级"""
+    indents = []
+    for line in f:
+        match = _MARKDOWN_ITEM.match(line)
+        if match:
+            indent, mark, text = match.groups()
+            width = len(indent.expandtabs(4))
+            while indents and width <= indents[-1]:
+                indents.pop()
+            depth = len(indents)
+            indents.append(width)
+            yield depth, {"text": text, "completed": mark in ("x", "X")}
+
+
+PARSERS = {
+    "jsonl": parse_jsonl,
+    "csv": parse_csv,
+    "md": parse_markdown,
+}
+
+
+def _make_record(fields, current_time):
+    return {
+        "text": str(fields["text"]).strip(),
+        "completed": _as_bool(fields.get("completed", False)),
+        "hidden": _as_bool(fields.get("hidden", False)),
+        "priority": parse_priority(fields.get("priority") or 0),
+        "due": normalize_due(fields.get("due")),
+        "created_at": fields.get("created_at") or current_time,
+        "updated_at": fields.get("updated_at") or current_time,
+        "subtasks": [],
+    }
+
+
+def iter_import_batches(f, fmt, batch_size=BATCH_SIZE):
+    """逐行解析文件，按批产出尚未分配ID的主任务列表（各级子任务已挂在父任务下）
+
+    带 parent_id 的子任务挂到同一主任务下ID相同的记录上，与行的先后顺序无关；
+    parent_id 找不到时挂到最近的主任务下。没有 parent_id 的子任务
+    （Markdown 缩进、JSON Lines 中嵌套的 subtasks）按层级挂到上一条较浅的记录下。
+    """
+    if fmt not in PARSERS:
+        raise ValueError(f"不支持的导入格式：{fmt}")
+    current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    batch = []
+    path = []  # 当前主任务到最近一条记录的路径
+    paths = {}  # 当前主任务下文件中的记录ID -> 从主任务到该记录的路径
+    for depth, fields in PARSERS[fmt](f):
+        if not str(fields.get("text") or "").strip():
+            continue
+        record = _make_record(fields, current_time)
+        depth = min(depth, len(path))
+        if depth > 0:
+            parent_id = str(fields.get("parent_id") or "")
+            if parent_id:
+                path = paths.get(parent_id, path[:1]) + [record]
+            else:
+                path = path[:depth] + [record]
+            path[-2]["subtasks"].append(record)
+        else:
+            # 新的主任务开始时才交出上一批，保证子任务不会被拆到下一批
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+            path = [record]
+            paths.clear()
+            batch.append(record)
+        if fields.get("id") not in (None, ""):
+            paths[str(fields["id"])] = path
+    if batch:
+        yield batch
+
+
+def _allocate_subtask_ids(record):
+    stack = [record]
+    while stack:
+        node = stack.pop()
+        for number, subtask in enumerate(node["subtasks"], 1):
+            subtask["id"] = f"{node['id']}-{number}"
+            subtask["order"] = number * ORDER_STEP
+            stack.append(subtask)
+
+
+def _allocate_ids(batch, first_id, first_order):
+    """为一批主任务及其各级子任务连续分配ID和排序键，返回下一个可用的 (主任务ID, order)"""
+    task_id = first_id
+    order = first_order
+    for task in batch:
+        task["id"] = task_id
+        task["order"] = order
+        _allocate_subtask_ids(task)
+        task_id += 1
+        order += ORDER_STEP
+    return task_id, order
+
+
+def append_batches(tasks, batches):
+    """逐批分配ID和排序键并追加到任务列表，每追加一批产出该批（界面和命令行共用）
+
+    整个过程是一次事务：batches 迭代出错时已追加的批次会全部撤销。
+    """
+    start = len(tasks)
+    next_id = new_task_id(tasks)
+    order = next_order(tasks)
+    try:
+        for batch in batches:
+            next_id, order = _allocate_ids(batch, next_id, order)
+            tasks.extend(batch)
+            yield batch
+    except BaseException:
+        del tasks[start:]
+        raise
+
+
+def import_tasks(tasks_data, path, fmt, batch_size=BATCH_SIZE):
+    """将文件中的任务逐批导入 tasks_data，返回导入的主任务数量
+
+    解析出错时已写入的批次会全部撤销。
+    """
+    count = 0
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        for batch in append_batches(tasks_data["tasks"], iter_import_batches(f, fmt, batch_size)):
+            count += len(batch)
+    return count
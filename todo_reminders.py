@@ -0,0 +1,120 @@
+"""截止时间队列：用最小堆维护未完成任务的截止时间，插入、改期和完成都是 O(log n)（不依赖Qt）"""
+import heapq
+import itertools
+
+
+def has_pending_due(record):
+    """设置了截止时间且尚未完成、未删除"""
+    return bool(record.get("due")) and not record.get("completed", False) \
+        and not record.get("hidden", False)
+
+
+def iter_visible_records(records):
+    """深度优先产出未删除的记录及其未删除的各级子任务"""
+    stack = list(records)
+    while stack:
+        record = stack.pop()
+        if record.get("hidden", False):
+            continue
+        yield record
+        stack.extend(record.get("subtasks", []))
+
+
+def iter_subtree(record):
+    """产出记录本身及其全部后代（包括已删除的）"""
+    stack = [record]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(node.get("subtasks", []))
+
+
+class DueQueue:
+    """按截止时间排序的最小堆
+
+    改期和完成时不在堆中查找旧条目，只把它标记为作废（惰性删除），
+    取堆顶时跳过作废条目，所以插入、改期、完成都是 O(log n)。
+    作废条目过多时整体重建一次堆，均摊后仍为 O(log n)。
+    截止时间是 "YYYY-MM-DD HH:MM:SS" 字符串，可以直接按字符串比较。
+    """
+
+    def __init__(self):
+        self._heap = []  # [due, seq, record_id]，record_id 为None表示已作废
+        self._entries = {}  # 记录ID -> 堆中有效的条目
+        self._seq = itertools.count()
+
+    @classmethod
+    def from_tasks(cls, tasks):
+        """从任务列表一次性建堆（O(n)）"""
+        queue = cls()
+        for record in iter_visible_records(tasks):
+            if has_pending_due(record):
+                queue._entries[record["id"]] = [record["due"], next(queue._seq), record["id"]]
+        queue._heap = list(queue._entries.values())
+        heapq.heapify(queue._heap)
+        return queue
+
+    def copy(self):
+        queue = DueQueue()
+        queue._entries = {record_id: list(entry) for record_id, entry in self._entries.items()}
+        queue._heap = list(queue._entries.values())
+        heapq.heapify(queue._heap)
+        queue._seq = itertools.count(next(self._seq))
+        return queue
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, record_id):
+        return record_id in self._entries
+
+    def push(self, record_id, due):
+        """加入或改期"""
+        self.remove(record_id)
+        entry = [due, next(self._seq), record_id]
+        self._entries[record_id] = entry
+        heapq.heappush(self._heap, entry)
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._heap = list(self._entries.values())
+            heapq.heapify(self._heap)
+
+    def remove(self, record_id):
+        entry = self._entries.pop(record_id, None)
+        if entry is not None:
+            entry[-1] = None
+
+    def update(self, record):
+        """根据记录当前的截止时间和完成状态加入、改期或移出队列"""
+        if not has_pending_due(record):
+            self.remove(record["id"])
+            return
+        entry = self._entries.get(record["id"])
+        if entry is None or entry[0] != record["due"]:
+            self.push(record["id"], record["due"])
+
+    def _drop_removed(self):
+        while self._heap and self._heap[0][-1] is None:
+            heapq.heappop(self._heap)
+
+    def peek(self):
+        """最早的 (due, record_id)，队列为空时返回None"""
+        self._drop_removed()
+        if not self._heap:
+            return None
+        due, _, record_id = self._heap[0]
+        return due, record_id
+
+    def pop_until(self, time):
+        """取出截止时间不晚于 time 的全部条目，按时间先后返回 [(due, record_id)]"""
+        result = []
+        while True:
+            top = self.peek()
+            if top is None or top[0] > time:
+                return result
+            heapq.heappop(self._heap)
+            del self._entries[top[1]]
+            result.append(top)
+
+    def nsmallest(self, n):
+        """最早的 n 个 (due, record_id)，不修改队列"""
+        return [(due, record_id) for due, _, record_id in heapq.nsmallest(n, self._entries.values())]
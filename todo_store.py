@@ -0,0 +1,643 @@
+"""任务数据存储和操作：文件锁、外部修改检测、增量合并以及任务增改（不依赖Qt，命令行模式共用）"""
+import json
+import math
+import os
+import secrets
+import stat
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class _HeldLocks(threading.local):
+    """当前线程已持有的锁（锁文件路径 -> 重入次数），支持同一线程内重入
+
+    按线程分别记录：其他线程需要自己取得真正的文件锁，
+    同一进程内的不同线程打开各自的锁文件句柄，彼此之间同样互斥。
+    """
+
+    def __init__(self):
+        self.counts = {}
+
+
+_held_locks = _HeldLocks()
+
+
+@contextmanager
+def file_lock(path):
+    """对任务文件加建议性锁（锁文件为 path + '.lock'）"""
+    lock_path = os.path.abspath(path) + '.lock'
+    held = _held_locks.counts
+    if lock_path in held:
+        held[lock_path] += 1
+        try:
+            yield
+        finally:
+            held[lock_path] -= 1
+        return
+
+    f = open(lock_path, 'a+')
+    try:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.05)
+        held[lock_path] = 1
+        try:
+            yield
+        finally:
+            del held[lock_path]
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    finally:
+        f.close()
+
+
+def file_fingerprint(path):
+    """返回文件指纹 (mtime_ns, size)，文件不存在时返回None"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def read_tasks(path):
+    """读取任务文件，文件不存在时返回空数据
+
+    内容不是合法的JSON或顶层结构不正确时抛出 ValueError（json.JSONDecodeError 也是 ValueError）。
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return check_tasks_data(json.load(f))
+    except FileNotFoundError:
+        return {"tasks": []}
+
+
+def _create_temp_file(directory, prefix):
+    """在目录中新建临时文件，返回 (fd, path)
+
+    与 tempfile.mkstemp 不同，文件按 0666 创建，实际权限由系统按 umask 决定，和普通新文件一致。
+    """
+    while True:
+        path = os.path.join(directory, f"{prefix}{secrets.token_hex(6)}.tmp")
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0),
+                         0o666)
+        except FileExistsError:
+            continue
+        return fd, path
+
+
+@contextmanager
+def atomic_write(path, prefix='.tmp-'):
+    """原子写入文本文件：先写到同目录的临时文件，成功后再替换原文件
+
+    path 是符号链接时替换链接指向的文件；替换后的文件沿用原文件的权限，
+    原文件不存在时与普通新文件一样按 umask 创建。
+    """
+    target = os.path.realpath(path)
+    fd, tmp_path = _create_temp_file(os.path.dirname(target), prefix)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            yield f
+        try:
+            os.chmod(tmp_path, stat.S_IMODE(os.stat(target).st_mode))
+        except FileNotFoundError:
+            pass
+        os.replace(tmp_path, target)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_tasks(path, data):
+    """原子写入任务文件，返回写入后的文件指纹"""
+    with atomic_write(path, prefix='.tasks-') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    return file_fingerprint(path)
+
+
+def check_tasks_data(data):
+    """检查任务文件的顶层结构，格式不正确时抛出 ValueError"""
+    if not isinstance(data, dict) or not isinstance(data.get("tasks", []), list):
+        raise ValueError("任务文件格式不正确：顶层应为包含 tasks 列表的对象")
+    return data
+
+
+def _valid_field(key, value):
+    """外部写入的字段类型不对时忽略该字段，id 和 subtasks 单独处理"""
+    if key in ("text", "created_at", "updated_at"):
+        return isinstance(value, str)
+    if key in ("completed", "hidden"):
+        return isinstance(value, bool)
+    if key == "order":
+        return isinstance(value, (int, float)) and not isinstance(value, bool) \
+            and math.isfinite(value)
+    if key == "priority":
+        return isinstance(value, int) and not isinstance(value, bool) \
+            and 0 <= value < len(PRIORITY_NAMES)
+    if key == "due":
+        return value is None or isinstance(value, str)
+    return key not in ("id", "subtasks")
+
+
+def _is_record(record, parent_id):
+    """外部数据中的记录需要有文本和合法的ID：主任务为整数，子任务为 "父ID-序号" """
+    if not isinstance(record, dict) or not isinstance(record.get("text"), str):
+        return False
+    record_id = record.get("id")
+    if parent_id is None:
+        return isinstance(record_id, int) and not isinstance(record_id, bool)
+    return isinstance(record_id, str) and record_id.startswith(f"{parent_id}-")
+
+
+def _remote_children(remote, parent_id):
+    children = remote.get("subtasks")
+    if not isinstance(children, list):
+        return []
+    return [child for child in children if _is_record(child, parent_id)]
+
+
+def _updated_at(record):
+    """缺少或不是字符串的 updated_at 视为最旧"""
+    value = record.get("updated_at")
+    return value if isinstance(value, str) else ""
+
+
+def _merge_record(local, remote):
+    """按 updated_at 合并单条记录的字段，远端较新时返回True"""
+    if _updated_at(remote) <= _updated_at(local):
+        return False
+    changed = False
+    for key, value in remote.items():
+        if _valid_field(key, value) and local.get(key) != value:
+            local[key] = value
+            changed = True
+    return changed
+
+
+def _new_record(remote, current_time):
+    """由外部新增的记录生成完整的记录（各级子任务一并处理），缺少的字段补上默认值
+
+    缺少排序键的子任务按列表位置补上。
+    """
+    record = {key: value for key, value in remote.items() if _valid_field(key, value)}
+    record["id"] = remote["id"]
+    for key, default in (("completed", False), ("hidden", False), ("priority", 0), ("due", None),
+                         ("created_at", current_time), ("updated_at", current_time)):
+        record.setdefault(key, default)
+    record["subtasks"] = [_new_record(child, current_time)
+                          for child in _remote_children(remote, record["id"])]
+    for number, subtask in enumerate(record["subtasks"], 1):
+        subtask.setdefault("order", number * ORDER_STEP)
+    return record
+
+
+def _merge_children(local_parent, remote_parent, task_id, changes, current_time):
+    local_children = {s["id"]: s for s in local_parent.setdefault("subtasks", [])}
+    for remote_subtask in _remote_children(remote_parent, local_parent["id"]):
+        subtask_id = remote_subtask["id"]
+        local_subtask = local_children.get(subtask_id)
+        if local_subtask is None:
+            subtask = _new_record(remote_subtask, current_time)
+            subtask.setdefault("order", next_order(local_parent["subtasks"]))
+            local_parent["subtasks"].append(subtask)
+            local_children[subtask_id] = subtask
+            changes.append((task_id, subtask_id))
+            continue
+        if _merge_record(local_subtask, remote_subtask):
+            changes.append((task_id, subtask_id))
+        _merge_children(local_subtask, remote_subtask, task_id, changes, current_time)
+
+
+def record_ids(tasks):
+    """任务列表中各级记录的ID集合，用于识别被外部删除的记录"""
+    ids = set()
+    stack = list(tasks)
+    while stack:
+        record = stack.pop()
+        if isinstance(record, dict) and isinstance(record.get("id"), (int, str)):
+            ids.add(record["id"])
+            children = record.get("subtasks")
+            if isinstance(children, list):
+                stack.extend(children)
+    return ids
+
+
+def _hide_removed(tasks, removed, changes, current_time):
+    """在本地隐藏被外部删除的记录，只处理最上层的一条（其下级随之不可见）"""
+    stack = list(tasks)
+    while stack:
+        record = stack.pop()
+        if record["id"] not in removed:
+            stack.extend(record.get("subtasks", []))
+            continue
+        if not record.get("hidden", False):
+            record["hidden"] = True
+            record["updated_at"] = current_time
+            task_id = root_id_of(record["id"])
+            changes.append((task_id, None if record["id"] == task_id else record["id"]))
+
+
+def merge_tasks(local, remote, saved_ids=None):
+    """将外部修改的数据合并到内存数据中
+
+    按任务ID和各级子任务ID逐条比较，冲突时以 updated_at 较新的一方为准。
+    saved_ids 为上次读取或写入文件时其中的记录ID：曾经在文件中、现在已不在的记录
+    视为被外部删除，在本地隐藏；其余只存在于本地的记录（尚未保存的新记录）保留不动。
+    saved_ids 为None时不识别删除。直接修改 local，返回变更列表
+    [(task_id, subtask_id)]，subtask_id 为None表示主任务本身发生变化。
+    新增和删除的子任务只报告最上层的一条。
+    外部脚本写入的数据可能不完整：没有ID或文本的记录被跳过，类型不对的字段被忽略；
+    顶层结构不正确时在修改 local 之前抛出 ValueError。
+    """
+    check_tasks_data(remote)
+    current_time = get_current_time()
+    changes = []
+    local_tasks = {task["id"]: task for task in local["tasks"]}
+
+    for remote_task in remote.get("tasks", []):
+        if not _is_record(remote_task, None):
+            continue
+        task_id = remote_task["id"]
+        local_task = local_tasks.get(task_id)
+        if local_task is None:
+            task = _new_record(remote_task, current_time)
+            task.setdefault("order", next_order(local["tasks"]))
+            local["tasks"].append(task)
+            local_tasks[task_id] = task
+            changes.append((task_id, None))
+            continue
+
+        if _merge_record(local_task, remote_task):
+            changes.append((task_id, None))
+        _merge_children(local_task, remote_task, task_id, changes, current_time)
+
+    if saved_ids:
+        removed = saved_ids - record_ids(remote.get("tasks", []))
+        if removed:
+            _hide_removed(local["tasks"], removed, changes, current_time)
+    return changes
+
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# 任务优先级，保存为下标
+PRIORITY_NAMES = ["无", "低", "中", "高"]
+
+# 截止时间可以省略秒或时间部分，只有日期时视为当天结束前
+_DUE_FORMATS = [("%Y-%m-%d %H:%M:%S", ""), ("%Y-%m-%d %H:%M", ":00"), ("%Y-%m-%d", " 23:59:59")]
+
+
+def get_current_time():
+    """获取当前时间的格式化字符串"""
+    return datetime.now().strftime(TIME_FORMAT)
+
+
+def parse_priority(value):
+    """将 0-3 或 无/低/中/高 转换为优先级下标"""
+    value = str(value).strip()
+    if value in PRIORITY_NAMES:
+        return PRIORITY_NAMES.index(value)
+    if value.isdigit() and int(value) < len(PRIORITY_NAMES):
+        return int(value)
+    raise ValueError(f"无效的优先级：{value}（可选 0-3 或 {'/'.join(PRIORITY_NAMES)}）")
+
+
+def normalize_due(value):
+    """将截止时间统一为 "YYYY-MM-DD HH:MM:SS"，空值返回None"""
+    if value is None or not str(value).strip():
+        return None
+    value = str(value).strip()
+    for fmt, suffix in _DUE_FORMATS:
+        try:
+            datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        return value + suffix
+    raise ValueError(f"无效的截止时间：{value}（格式为 YYYY-MM-DD [HH:MM[:SS]]）")
+
+
+def set_task_properties(record, priority, due, current_time):
+    """设置任务或子任务的优先级和截止时间（due 为None表示取消截止时间）"""
+    record["priority"] = priority
+    record["due"] = normalize_due(due)
+    record["updated_at"] = current_time
+
+
+def new_task_id(tasks):
+    """下一个可用的主任务ID"""
+    return max((task["id"] for task in tasks), default=0) + 1
+
+
+def new_subtask_id(parent):
+    """父任务下的下一个子任务ID，格式为 "父任务ID-序号"，如 3-1、3-1-2"""
+    numbers = [int(str(subtask["id"]).rsplit('-', 1)[1]) for subtask in parent.get("subtasks", [])]
+    return f"{parent['id']}-{max(numbers, default=0) + 1}"
+
+
+def parent_id_of(record_id):
+    """由层级ID得到父任务ID，主任务返回None（主任务ID为整数）"""
+    if isinstance(record_id, int):
+        return None
+    parent_id = record_id.rsplit('-', 1)[0]
+    return int(parent_id) if '-' not in parent_id else parent_id
+
+
+def root_id_of(record_id):
+    """由层级ID得到所属主任务的ID"""
+    if isinstance(record_id, int):
+        return record_id
+    return int(record_id.split('-', 1)[0])
+
+
+def parse_record_id(value):
+    """将命令行等外部输入的ID字符串转换为内部ID"""
+    return int(value) if '-' not in value else value
+
+
+# 排序键：每个任务和子任务保存一个浮点数 order，列表按 order 排序显示。
+# 移动时只修改被移动记录的 order（取前后相邻记录的中间值），
+# 只有相邻间隔过小时才重新均匀分配同级记录的 order。
+ORDER_STEP = 1024.0
+MIN_ORDER_GAP = 1e-6
+
+
+def order_of(record):
+    return record.get("order", 0.0)
+
+
+def sorted_by_order(records):
+    return sorted(records, key=order_of)
+
+
+def next_order(records):
+    """排在所有记录之后的 order"""
+    return max((order_of(r) for r in records), default=0.0) + ORDER_STEP
+
+
+def order_between(before, after):
+    """介于两个 order 之间的值，None 表示没有前一个/后一个"""
+    if before is None and after is None:
+        return ORDER_STEP
+    if before is None:
+        return after - ORDER_STEP
+    if after is None:
+        return before + ORDER_STEP
+    return (before + after) / 2
+
+
+def rebalance_order(records, current_time):
+    """按当前顺序重新均匀分配 order"""
+    for index, record in enumerate(sorted_by_order(records), 1):
+        record["order"] = index * ORDER_STEP
+        record["updated_at"] = current_time
+
+
+def ensure_order(tasks):
+    """为缺少 order 的记录补充排序键，返回是否有修改
+
+    同级记录都没有 order 时（旧数据）按列表中的位置编号；
+    只有部分记录缺少时（如外部脚本追加的任务），保留已有的顺序，缺少的排到最后。
+    """
+    changed = False
+    stack = [tasks]
+    while stack:
+        records = stack.pop()
+        missing = [record for record in records if "order" not in record]
+        if len(missing) == len(records):
+            for index, record in enumerate(records, 1):
+                record["order"] = index * ORDER_STEP
+        else:
+            order = next_order(records)
+            for record in missing:
+                record["order"] = order
+                order += ORDER_STEP
+        changed = changed or bool(missing)
+        stack.extend(record.setdefault("subtasks", []) for record in records)
+    return changed
+
+
+def move_between(record, before, after, siblings, current_time):
+    """将记录移动到 before 和 after 两条记录之间（None 表示列表两端）
+
+    通常只修改 record 一条记录；间隔过小时会重排 siblings，此时返回True。
+    """
+    rebalanced = False
+    if (before is not None and after is not None and
+            order_of(after) - order_of(before) < MIN_ORDER_GAP):
+        rebalance_order(siblings, current_time)
+        rebalanced = True
+    record["order"] = order_between(
+        order_of(before) if before is not None else None,
+        order_of(after) if after is not None else None)
+    record["updated_at"] = current_time
+    return rebalanced
+
+
+def new_task(task_id, text, current_time, order):
+    """新的主任务数据结构"""
+    return {
+        "id": task_id,
+        "text": text,
+        "completed": False,
+        "hidden": False,
+        "order": order,
+        "priority": 0,
+        "due": None,
+        "created_at": current_time,
+        "updated_at": current_time,
+        "subtasks": []  # 子任务列表，每个子任务都是完整的任务数据结构，可以继续嵌套
+    }
+
+
+def add_subtasks(parent, texts, current_time):
+    """为主任务或子任务追加子任务，返回新建的子任务列表"""
+    added = []
+    children = parent.setdefault("subtasks", [])
+    order = next_order(children)
+    for text in texts:
+        subtask = {
+            "id": new_subtask_id(parent),
+            "text": text,
+            "completed": False,
+            "hidden": False,
+            "order": order,
+            "priority": 0,
+            "due": None,
+            "created_at": current_time,
+            "updated_at": current_time,
+            "subtasks": []
+        }
+        children.append(subtask)
+        added.append(subtask)
+        order += ORDER_STEP
+    if added:
+        parent["updated_at"] = current_time
+    return added
+
+
+def visible_subtasks(record):
+    return [s for s in record.get("subtasks", []) if not s.get("hidden", False)]
+
+
+class TaskIndex:
+    """任务树索引：按ID查找任意层级的记录，并为每个节点维护完成计数
+
+    counts[id] = [未隐藏的直接子任务数, 其中已完成的数量]。
+    勾选状态变化时只沿祖先链增量更新计数，不需要重新扫描整棵子树。
+    """
+
+    def __init__(self, tasks):
+        self.nodes = {}
+        self.counts = {}
+        for task in tasks:
+            self.add(task)
+
+    def get(self, record_id):
+        return self.nodes.get(record_id)
+
+    def parent(self, record):
+        parent_id = parent_id_of(record["id"])
+        return None if parent_id is None else self.nodes.get(parent_id)
+
+    def add(self, record, parent=None):
+        """登记一条记录及其全部子任务，并重新计算它们的完成计数
+
+        对已登记的主任务再次调用时会重新计算整棵子树的计数，外部合并后用它重建计数。
+        """
+        stack = [(record, parent)]
+        while stack:
+            node, node_parent = stack.pop()
+            self.nodes[node["id"]] = node
+            counts = self.counts[node["id"]] = [0, 0]
+            for child in node.get("subtasks", []):
+                if not child.get("hidden", False):
+                    counts[0] += 1
+                    counts[1] += bool(child.get("completed", False))
+                stack.append((child, node))
+            if node is record and node_parent is not None and not node.get("hidden", False):
+                parent_counts = self.counts[node_parent["id"]]
+                parent_counts[0] += 1
+                parent_counts[1] += bool(node.get("completed", False))
+
+    def has_visible_children(self, record):
+        return self.counts.get(record["id"], (0, 0))[0] > 0
+
+    def all_children_completed(self, record):
+        visible, done = self.counts.get(record["id"], (0, 0))
+        return visible > 0 and done == visible
+
+    def _set_completed(self, record, is_checked, current_time):
+        if record.get("completed", False) != is_checked and not record.get("hidden", False):
+            parent = self.parent(record)
+            if parent is not None:
+                self.counts[parent["id"]][1] += 1 if is_checked else -1
+        record["completed"] = is_checked
+        record["updated_at"] = current_time
+
+    def set_completed(self, record, is_checked, current_time):
+        """更新任务状态，返回状态被连带修改的其他记录
+
+        勾选一个任务（或取消勾选一个子任务全部完成的任务）时，同步所有未隐藏的后代；
+        之后沿祖先链向上，父任务在所有未隐藏子任务完成时视为完成。
+        """
+        cascade = is_checked or self.all_children_completed(record)
+        self._set_completed(record, is_checked, current_time)
+        changed = []
+
+        if cascade:
+            stack = visible_subtasks(record)
+            while stack:
+                node = stack.pop()
+                self._set_completed(node, is_checked, current_time)
+                changed.append(node)
+                stack.extend(visible_subtasks(node))
+
+        node = record
+        parent = self.parent(node)
+        while parent is not None:
+            all_completed = self.all_children_completed(parent)
+            if parent.get("completed", False) == all_completed:
+                parent["updated_at"] = current_time
+                break
+            self._set_completed(parent, all_completed, current_time)
+            changed.append(parent)
+            node, parent = parent, self.parent(parent)
+        return changed
+
+    def add_subtasks(self, parent, texts, current_time):
+        """追加子任务并登记到索引"""
+        added = add_subtasks(parent, texts, current_time)
+        for subtask in added:
+            self.add(subtask, parent)
+        return added
+
+    def hide(self, record, current_time):
+        """删除（隐藏）任务或子任务"""
+        if not record.get("hidden", False):
+            parent = self.parent(record)
+            if parent is not None:
+                counts = self.counts[parent["id"]]
+                counts[0] -= 1
+                counts[1] -= bool(record.get("completed", False))
+                parent["updated_at"] = current_time
+        record["hidden"] = True
+        record["updated_at"] = current_time
+
+
+def _clean_subtask(subtask, current_time):
+    clean = {
+        "id": subtask["id"],
+        "text": subtask["text"],
+        "completed": subtask.get("completed", False),
+        "hidden": subtask.get("hidden", False),
+        "order": order_of(subtask),
+        "priority": subtask.get("priority", 0),
+        "due": subtask.get("due"),
+        "created_at": subtask.get("created_at", current_time),
+        "updated_at": subtask.get("updated_at", current_time)
+    }
+    children = [_clean_subtask(child, current_time)
+                for child in subtask.get("subtasks", []) if isinstance(child, dict)]
+    if children:
+        clean["subtasks"] = children
+    return clean
+
+
+def clean_tasks(tasks, current_time):
+    """清理数据，确保只保存基本数据类型"""
+    clean = []
+    for task in tasks:
+        clean.append({
+            "id": task["id"],
+            "text": task["text"],
+            "completed": task.get("completed", False),
+            "hidden": task.get("hidden", False),
+            "order": order_of(task),
+            "priority": task.get("priority", 0),
+            "due": task.get("due"),
+            "created_at": task["created_at"],
+            "updated_at": task["updated_at"],
+            "subtasks": [_clean_subtask(subtask, current_time)
+                         for subtask in task.get("subtasks", []) if isinstance(subtask, dict)]
+        })
+    return clean
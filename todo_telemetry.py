@@ -0,0 +1,220 @@
+"""AI调用统计：逐条记录耗时、Token用量和失败原因，并按天汇总延迟百分位数和费用（不依赖Qt）"""
+import json
+import math
+import threading
+import unicodedata
+from datetime import date, datetime, timedelta
+
+from todo_store import atomic_write, file_lock
+
+
+TELEMETRY_FILE = 'ai_telemetry.jsonl'
+DEFAULT_RETENTION_DAYS = 30
+
+# 每次调用记录的各阶段耗时（毫秒）
+# dns_ms/connect_ms 只在新建连接时不为0，ttfb_ms 为收到响应头的时间，
+# total_ms 包含读取和解码响应体，parse_ms 为拆分子任务文本的时间
+LATENCY_FIELDS = ["dns_ms", "connect_ms", "ttfb_ms", "total_ms", "parse_ms"]
+PERCENTILES = [50, 95, 99]
+
+
+def _read_time(line):
+    try:
+        return json.loads(line)["time"]
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def iter_records(path=TELEMETRY_FILE, since=None):
+    """逐行读取调用记录，since 为 "YYYY-MM-DD" 时只返回该日期及之后的记录
+
+    写入中断留下的残缺行会被跳过。
+    """
+    try:
+        f = open(path, 'r', encoding='utf-8')
+    except FileNotFoundError:
+        return
+    with f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if since and record.get("time", "")[:10] < since:
+                continue
+            yield record
+
+
+class TelemetryStore:
+    """AI调用记录，逐行追加到 ai_telemetry.jsonl，只保留最近 retention_days 天
+
+    多个线程和进程可以同时写入；每天第一次写入时清理过期记录。
+    """
+
+    def __init__(self, path=TELEMETRY_FILE, retention_days=DEFAULT_RETENTION_DAYS):
+        self.path = path
+        self.retention_days = max(1, retention_days)
+        self._lock = threading.Lock()
+        self._pruned_day = None
+
+    def record(self, entry):
+        entry = dict(entry, time=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        line = json.dumps(entry, ensure_ascii=False)
+        today = entry["time"][:10]
+        with self._lock, file_lock(self.path):
+            if self._pruned_day != today:
+                self._prune(today)
+                self._pruned_day = today
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+    def _prune(self, today):
+        cutoff = (date.fromisoformat(today) - timedelta(days=self.retention_days - 1)).isoformat()
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                first_time = _read_time(f.readline())
+        except FileNotFoundError:
+            return
+        # 记录按时间追加，第一条没有过期就不需要重写文件
+        if first_time is not None and first_time[:10] >= cutoff:
+            return
+
+        with atomic_write(self.path, prefix='.telemetry-') as out, \
+                open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                record_time = _read_time(line)
+                if record_time is not None and record_time[:10] >= cutoff:
+                    out.write(line)
+
+def percentile(sorted_values, q):
+    """最近秩法百分位数，sorted_values 需已按升序排列"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class _Stats:
+    """一组调用记录的累计值"""
+
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.subtasks = 0
+        self.latencies = {field: [] for field in LATENCY_FIELDS}
+
+    def add(self, record):
+        self.calls += 1
+        if record.get("error"):
+            self.failures += 1
+        self.prompt_tokens += record.get("prompt_tokens") or 0
+        self.completion_tokens += record.get("completion_tokens") or 0
+        self.subtasks += record.get("subtasks") or 0
+        for field in LATENCY_FIELDS:
+            value = record.get(field)
+            if value is not None:
+                self.latencies[field].append(value)
+
+    def result(self, prompt_price, completion_price):
+        latency = {}
+        for field, values in self.latencies.items():
+            values.sort()
+            latency[field] = {f"p{q}": percentile(values, q) for q in PERCENTILES}
+        cost = (self.prompt_tokens * prompt_price +
+                self.completion_tokens * completion_price) / 1_000_000
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "subtasks": self.subtasks,
+            "cost": round(cost, 6),
+            "latency_ms": latency,
+        }
+
+
+def summarize(records, prompt_price=0.0, completion_price=0.0):
+    """按天汇总调用记录
+
+    prompt_price/completion_price 为每百万Token的价格。
+    返回 {"overall", "days", "status_codes", "errors"}，days 按日期升序。
+    """
+    overall = _Stats()
+    days = {}
+    status_codes = {}
+    errors = {}
+    for record in records:
+        overall.add(record)
+        day = record.get("time", "")[:10]
+        if day not in days:
+            days[day] = _Stats()
+        days[day].add(record)
+        status = str(record.get("status") or "无响应")
+        status_codes[status] = status_codes.get(status, 0) + 1
+        if record.get("error"):
+            errors[record["error"]] = errors.get(record["error"], 0) + 1
+    return {
+        "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "price_per_million_tokens": {"prompt": prompt_price, "completion": completion_price},
+        "overall": overall.result(prompt_price, completion_price),
+        "days": [dict(date=day, **stats.result(prompt_price, completion_price))
+                 for day, stats in sorted(days.items())],
+        "status_codes": status_codes,
+        "errors": errors,
+    }
+
+
+def load_summary(config, path=TELEMETRY_FILE, since=None):
+    """读取调用记录并按 config 中的Token价格汇总"""
+    return summarize(iter_records(path, since),
+                     float(config.get("ai_price_per_million_prompt_tokens", 0)),
+                     float(config.get("ai_price_per_million_completion_tokens", 0)))
+
+
+def export_summary(summary, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+
+
+def _format_ms(value):
+    return "-" if value is None else f"{value:.0f}"
+
+
+def _pad(text, width, left=False):
+    """按显示宽度补齐（中文字符占两列）"""
+    text = str(text)
+    padding = " " * max(0, width - sum(
+        2 if unicodedata.east_asian_width(c) in "WF" else 1 for c in text))
+    return text + padding if left else padding + text
+
+
+# 统计表格的列：(标题, 宽度)
+_COLUMNS = [("日期", 10), ("调用", 6), ("失败", 6), ("p50", 7), ("p95", 7), ("p99", 7),
+            ("首字节p50", 11), ("输入Token", 11), ("输出Token", 11), ("费用", 10)]
+
+
+def format_summary(summary):
+    """将汇总结果格式化为文本表格（命令行和统计窗口共用）"""
+    lines = ["  ".join(_pad(title, width, index == 0)
+                       for index, (title, width) in enumerate(_COLUMNS))]
+    for row in summary["days"] + [dict(date="合计", **summary["overall"])]:
+        total = row["latency_ms"]["total_ms"]
+        values = [row["date"], row["calls"], row["failures"],
+                  _format_ms(total["p50"]), _format_ms(total["p95"]), _format_ms(total["p99"]),
+                  _format_ms(row["latency_ms"]["ttfb_ms"]["p50"]),
+                  row["prompt_tokens"], row["completion_tokens"], f"{row['cost']:.4f}"]
+        lines.append("  ".join(_pad(value, width, index == 0)
+                               for index, (value, (_, width)) in enumerate(zip(values, _COLUMNS))))
+    lines.append("")
+    lines.append("耗时单位为毫秒，p50/p95/p99 为总耗时")
+    phases = summary["overall"]["latency_ms"]
+    lines.append("各阶段 p50：" + "  ".join(
+        f"{field}={_format_ms(phases[field]['p50'])}" for field in LATENCY_FIELDS))
+    lines.append("状态码：" + ("  ".join(f"{code}×{count}" for code, count in
+                                      sorted(summary["status_codes"].items())) or "-"))
+    lines.append("失败原因：" + ("  ".join(f"{name}×{count}" for name, count in
+                                       sorted(summary["errors"].items(),
+                                              key=lambda item: -item[1])) or "-"))
+    return "\n".join(lines)